@@ -0,0 +1,7 @@
+"""
+Helpers for the Latent Semantic Analysis notebook.
+
+The notebook imports what it needs from the submodules directly, e.g.
+``from lsa.spark_lsa import spark_lsa``, so that importing this package does
+not pull in Spark or Scikit-Learn until they are actually used.
+"""
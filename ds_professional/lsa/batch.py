@@ -0,0 +1,261 @@
+"""
+Run the notebook's LSA on many bodies in one pool of worker processes.
+
+Instead of running a copy of the notebook per body, ``run_batch`` reads a
+manifest of corpora and their parameters and runs read -> vectorize -> SVD
+-> write for each of them. Every worker imports NumPy, pandas and
+Scikit-Learn once and then takes job after job; this module itself only
+imports the standard library, so starting the runner is cheap. Downloads go
+through the shared ``fetch`` cache and fits through a shared ``ModelCache``,
+so a corpus that has not changed since the last run is not refitted.
+
+For every corpus the runner writes ``<output>/<name>/encoding_matrix.parquet``
+(topic loadings and ``terms``, as in the notebook) and the topic embeddings
+of every document as an ``EmbeddingStore`` in ``<output>/<name>/embeddings``.
+``report.json`` in ``<output>`` holds per-job timings and the throughput of
+the whole batch.
+
+  python -m lsa.batch manifest.json --output /dbfs/tmp/lsa_batch --workers 8
+
+A manifest is a JSON list of corpora, or an object with ``defaults`` and a
+``corpora`` list, or a JSON-lines file with one corpus per line::
+
+  {"defaults": {"n_components": 2, "count_params": {"min_df": 1, "stop_words": "english"}},
+   "corpora": [{"name": "poems", "source": "https://files.training.databricks.com/classes/lsa-videos/body.csv",
+                "label_cols": ["title"]}]}
+
+``source`` is a URL, a CSV file or a Parquet data set; ``text_col``
+(``"sentence"``), ``label_cols``, ``weighting`` (``"count"`` or
+``"tfidf"``), ``n_components``, ``random_state`` and ``count_params`` may be
+set per corpus or in ``defaults``.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+DEFAULTS = {"text_col": "sentence", "label_cols": [], "weighting": "count", "n_components": 2,
+            "random_state": 0, "count_params": {"min_df": 1, "stop_words": "english"}}
+
+DEFAULT_MODEL_CACHE = os.path.join(tempfile.gettempdir(), "lsa_models")
+
+# The model cache of the current worker process, opened by _init_worker.
+_model_cache = None
+
+
+def load_manifest(path):
+  """The jobs of the manifest at ``path``, each with the defaults filled in."""
+  with open(path, encoding="utf-8") as handle:
+    if path.endswith(".jsonl"):
+      manifest = [json.loads(line) for line in handle if line.strip()]
+    else:
+      manifest = json.load(handle)
+  if isinstance(manifest, dict):
+    defaults, corpora = manifest.get("defaults", {}), manifest["corpora"]
+  else:
+    defaults, corpora = {}, manifest
+
+  jobs, names = [], set()
+  for corpus in corpora:
+    job = dict(DEFAULTS, **defaults)
+    job.update(corpus)
+    if "source" not in job:
+      raise ValueError("corpus {!r} has no source".format(job.get("name")))
+    job.setdefault("name", os.path.splitext(os.path.basename(job["source"].rstrip("/")))[0])
+    if job["name"] in names:
+      raise ValueError("corpus name {!r} appears twice in {}".format(job["name"], path))
+    names.add(job["name"])
+    jobs.append(job)
+  return jobs
+
+
+def _is_url(source):
+  return source.startswith(("http://", "https://"))
+
+
+def _fetch_sources(jobs, download_dir, fetch_cache_dir):
+  # Downloads run here, once per URL, so that no two workers ever write the
+  # same partial download.
+  from lsa.fetch import DEFAULT_CACHE_DIR, fetch
+
+  fetched = {}
+  for job in jobs:
+    source = job["source"]
+    if not _is_url(source) or source in fetched:
+      continue
+    name = hashlib.sha1(source.encode("utf-8")).hexdigest()[:16] + "-" + os.path.basename(source)
+    try:
+      fetched[source] = fetch(source, os.path.join(download_dir, name), sha256=job.get("sha256"),
+                              cache_dir=fetch_cache_dir or DEFAULT_CACHE_DIR)
+    except (IOError, OSError) as error:
+      fetched[source] = error
+  return fetched
+
+
+def _init_worker(model_cache_dir, model_cache_bytes):
+  global _model_cache
+  # Pay for the heavy imports once per worker rather than once per job.
+  import numpy  # noqa: F401
+  import pandas  # noqa: F401
+  import sklearn.decomposition  # noqa: F401
+  import sklearn.feature_extraction.text  # noqa: F401
+  from lsa.cache import ModelCache
+
+  _model_cache = ModelCache(model_cache_dir, max_bytes=model_cache_bytes)
+
+
+def _read_body(path, columns):
+  import pandas as pd
+
+  if os.path.isdir(path) or path.endswith(".parquet"):
+    from lsa.ingest import read_body_pandas
+    return read_body_pandas(path, columns=columns, arrow_dtypes=False)
+  return pd.read_csv(path, usecols=columns)
+
+
+def _label_values(column):
+  # Text labels come back from read_csv as objects, possibly with NaN for an
+  # empty field; the embedding store keeps fixed-width strings.
+  import numpy as np
+  from pandas.api.types import is_object_dtype, is_string_dtype
+
+  if is_object_dtype(column) or is_string_dtype(column):
+    return np.asarray(column.fillna("").astype(str), dtype=str)
+  return column.to_numpy()
+
+
+def run_job(job, output_dir):
+  """
+  Fit and write one corpus of the manifest; runs in a worker process.
+
+  Returns a dict of timings (``read_s``, ``fit_s``, ``write_s``), sizes and
+  ``status``; an exception is reported as ``status="failed"`` rather than
+  raised, so one bad corpus does not stop the batch.
+  """
+  report = {"corpus": job["name"], "status": "ok", "pid": os.getpid()}
+  start = time.perf_counter()
+  try:
+    import numpy as np
+    import pandas as pd
+    from lsa.cache import cached_lsa
+    from lsa.embedding_store import write_embedding_store
+    from lsa.topics import topic_columns
+
+    stage_start = time.perf_counter()
+    text_col, label_cols = job["text_col"], list(job["label_cols"])
+    body = _read_body(job["path"], [text_col] + label_cols).dropna(subset=[text_col]).reset_index(drop=True)
+    report["read_s"] = time.perf_counter() - stage_start
+
+    stage_start = time.perf_counter()
+    # The key has to name the column and the dropped rows, or two jobs on one
+    # file with different text columns would share a cache entry.
+    fit = cached_lsa(_model_cache, job["path"], body[text_col], weighting=job["weighting"],
+                     n_components=job["n_components"], random_state=job["random_state"], text_col=text_col,
+                     selection={"dropna": text_col}, **job["count_params"])
+    report["fit_s"] = time.perf_counter() - stage_start
+
+    stage_start = time.perf_counter()
+    corpus_dir = os.path.join(output_dir, job["name"])
+    os.makedirs(corpus_dir, exist_ok=True)
+    columns = topic_columns(job["n_components"])
+    encoding_matrix = pd.DataFrame(np.asarray(fit.components).T, columns=columns)
+    encoding_matrix["terms"] = fit.dictionary
+    encoding_matrix.to_parquet(os.path.join(corpus_dir, "encoding_matrix.parquet"), index=False)
+    write_embedding_store(os.path.join(corpus_dir, "embeddings"), fit.lsa, body[text_col],
+                          labels={col: _label_values(body[col]) for col in label_cols}, columns=columns,
+                          text_col=text_col)
+    report["write_s"] = time.perf_counter() - stage_start
+
+    report.update(n_documents=len(body), n_terms=len(fit.dictionary), cache_hit=fit.hit)
+  except Exception as error:
+    report.update(status="failed", error="{}: {}".format(type(error).__name__, error))
+  report["seconds"] = time.perf_counter() - start
+  return report
+
+
+def run_batch(jobs, output_dir, n_workers=None, model_cache_dir=DEFAULT_MODEL_CACHE, model_cache_bytes=1 << 32,
+              download_dir=None, fetch_cache_dir=None):
+  """
+  Run every job of a manifest over ``n_workers`` processes.
+
+  Returns ``(report, summary)``: a DataFrame with one row per corpus and the
+  totals of the batch (jobs, failures, documents, wall time, documents and
+  jobs per second). Both are also written to ``<output_dir>/report.json``.
+  """
+  start = time.perf_counter()
+  os.makedirs(output_dir, exist_ok=True)
+  download_dir = download_dir or os.path.join(output_dir, "_downloads")
+  os.makedirs(download_dir, exist_ok=True)
+  fetched = _fetch_sources(jobs, download_dir, fetch_cache_dir)
+
+  reports, runnable = [], []
+  for job in jobs:
+    job = dict(job, path=job["source"])
+    download = fetched.get(job["source"])
+    if isinstance(download, Exception):
+      reports.append({"corpus": job["name"], "status": "failed", "seconds": 0.0,
+                      "error": "{}: {}".format(type(download).__name__, download)})
+      continue
+    if download is not None:
+      job.update(path=download.path)
+    runnable.append((job, download))
+
+  n_workers = max(1, min(n_workers or os.cpu_count() or 1, len(runnable) or 1))
+  if n_workers == 1:
+    _init_worker(model_cache_dir, model_cache_bytes)
+    results = [run_job(job, output_dir) for job, _ in runnable]
+  else:
+    with ProcessPoolExecutor(max_workers=n_workers, initializer=_init_worker,
+                             initargs=(model_cache_dir, model_cache_bytes)) as pool:
+      futures = [pool.submit(run_job, job, output_dir) for job, _ in runnable]
+      results = [future.result() for future in futures]
+
+  for (job, download), result in zip(runnable, results):
+    if download is not None:
+      result.update(fetch_s=download.seconds, fetch_hit=download.cache_hit)
+    reports.append(result)
+
+  import pandas as pd
+
+  report = pd.DataFrame(reports)
+  if "n_documents" in report:
+    report["documents_per_second"] = report["n_documents"] / report["seconds"]
+  order = ["corpus", "status", "n_documents", "n_terms", "cache_hit", "fetch_s", "fetch_hit", "read_s", "fit_s",
+           "write_s", "seconds", "documents_per_second", "pid", "error"]
+  report = report[[column for column in order if column in report.columns]]
+  wall = time.perf_counter() - start
+  n_documents = int(report["n_documents"].fillna(0).sum()) if "n_documents" in report else 0
+  summary = {"jobs": len(report), "failed": int((report["status"] == "failed").sum()), "workers": n_workers,
+             "documents": n_documents, "wall_s": wall, "documents_per_second": n_documents / wall,
+             "jobs_per_second": len(report) / wall}
+  with open(os.path.join(output_dir, "report.json"), "w") as handle:
+    json.dump({"summary": summary, "jobs": json.loads(report.to_json(orient="records"))}, handle, indent=2)
+  return report, summary
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description="Run the LSA pipeline on every corpus of a manifest.")
+  parser.add_argument("manifest", help="JSON or JSON-lines manifest of corpora")
+  parser.add_argument("--output", required=True, help="directory for the per-corpus outputs and report.json")
+  parser.add_argument("--workers", type=int, default=None, help="worker processes (default: one per core)")
+  parser.add_argument("--model-cache", default=DEFAULT_MODEL_CACHE, help="directory of the shared ModelCache")
+  parser.add_argument("--model-cache-bytes", type=int, default=1 << 32)
+  parser.add_argument("--download-dir", default=None, help="where downloaded sources are placed")
+  parser.add_argument("--fetch-cache", default=None, help="directory of the shared download cache")
+  args = parser.parse_args(argv)
+
+  report, summary = run_batch(load_manifest(args.manifest), args.output, n_workers=args.workers,
+                              model_cache_dir=args.model_cache, model_cache_bytes=args.model_cache_bytes,
+                              download_dir=args.download_dir, fetch_cache_dir=args.fetch_cache)
+  print(report.to_string(index=False))
+  print(json.dumps(summary, indent=2))
+  if summary["failed"]:
+    raise SystemExit(1)
+
+
+if __name__ == "__main__":
+  main()
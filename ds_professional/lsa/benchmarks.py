@@ -0,0 +1,440 @@
+"""
+Benchmarks for the helpers in ``lsa`` against the notebook's baseline code.
+
+Every ``benchmark_*`` function returns a pandas DataFrame with one row per
+variant so that results can be displayed in the notebook or saved to disk.
+
+``run_benchmark_suite`` times every stage of the notebook on synthetic
+corpora of growing size and can be run offline from the command line,
+comparing against the results of an earlier run::
+
+  python -m lsa.benchmarks --scales 1000 10000 100000 --output results.json --baseline previous.json
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import time
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+
+def _timed(fn, *args, **kwargs):
+  start = time.perf_counter()
+  result = fn(*args, **kwargs)
+  return result, time.perf_counter() - start
+
+
+def _captured_energy(X, components):
+  # Squared Frobenius norm of X projected onto the topic space; larger is
+  # better and the exact SVD maximizes it.
+  projected = X @ components.T
+  return float(np.square(projected).sum())
+
+
+def _subspace_error(components, reference):
+  # sin of the largest principal angle between two topic spaces.
+  overlap = np.linalg.svd(components @ reference.T, compute_uv=False)
+  return float(np.sqrt(max(0.0, 1.0 - overlap.min() ** 2)))
+
+
+def benchmark_svd(X, n_components=2, n_append=None, n_iter=5, warm_n_iter=1, random_state=0):
+  """
+  Compare refitting ``TruncatedSVD`` from scratch with ``IncrementalTruncatedSVD``.
+
+  The last ``n_append`` rows of ``X`` (10% by default) play the part of newly
+  arrived lines. Accuracy is measured against an exact ``scipy.sparse.linalg.svds``
+  of the full matrix: ``energy_ratio`` is the captured energy relative to the
+  exact SVD and ``subspace_error`` is the sine of the largest principal angle.
+  """
+  from scipy.sparse.linalg import svds
+  from sklearn.decomposition import TruncatedSVD
+  from lsa.svd import IncrementalTruncatedSVD
+
+  X = sp.csr_matrix(X, dtype=np.float64)
+  n_append = n_append or max(1, X.shape[0] // 10)
+  X_old, X_new = X[:-n_append], X[-n_append:]
+
+  _, _, exact = svds(X, k=n_components)
+  exact_energy = _captured_energy(X, exact)
+
+  variants = []
+
+  baseline = TruncatedSVD(n_components=n_components, n_iter=n_iter, random_state=random_state)
+  _, seconds = _timed(baseline.fit, X)
+  variants.append(("TruncatedSVD full refit", seconds, baseline.components_))
+
+  full = IncrementalTruncatedSVD(n_components=n_components, n_iter=n_iter, random_state=random_state)
+  _, seconds = _timed(full.fit, X)
+  variants.append(("randomized full refit", seconds, full.components_))
+
+  previous = IncrementalTruncatedSVD(n_components=n_components, n_iter=n_iter,
+                                     random_state=random_state).fit(X_old)
+  previous.set_params(warm_start=True, n_iter=warm_n_iter)
+  _, seconds = _timed(previous.fit, X)
+  variants.append(("warm start refit (n_iter={})".format(warm_n_iter), seconds, previous.components_))
+
+  incremental = IncrementalTruncatedSVD(n_components=n_components, n_iter=n_iter,
+                                        random_state=random_state).fit(X_old)
+  incremental.set_params(n_iter=warm_n_iter)
+  _, seconds = _timed(incremental.partial_fit, X_new)
+  variants.append(("partial_fit appended rows", seconds, incremental.components_))
+
+  return pd.DataFrame([
+    {"variant": name,
+     "seconds": seconds,
+     "energy_ratio": _captured_energy(X, components) / exact_energy,
+     "subspace_error": _subspace_error(components, exact)}
+    for name, seconds, components in variants])
+
+
+def benchmark_search(vectors, queries, k=10, n_lists=None, n_probes=(1, 2, 4, 8, 16), random_state=0):
+  """
+  Recall and latency of ``IVFIndex`` for several ``n_probe`` against brute force.
+
+  ``recall`` is the fraction of the exact top-``k`` ids the index returns,
+  averaged over ``queries``; latencies are per query for the whole batch.
+  """
+  from lsa.search import IVFIndex, brute_force_search
+
+  (_, exact_ids), seconds = _timed(brute_force_search, vectors, queries, k=k)
+  rows = [{"variant": "brute force", "n_probe": None, "recall": 1.0,
+           "ms_per_query": 1000 * seconds / len(queries)}]
+
+  index, build_seconds = _timed(IVFIndex(n_lists=n_lists, random_state=random_state).fit, vectors)
+  for n_probe in n_probes:
+    if n_probe > index.centroids_.shape[0]:
+      break
+    (_, ids), seconds = _timed(index.search, queries, k=k, n_probe=n_probe)
+    hits = sum(len(np.intersect1d(found[found >= 0], exact)) for found, exact in zip(ids, exact_ids))
+    rows.append({"variant": "IVF ({} lists)".format(index.centroids_.shape[0]), "n_probe": n_probe,
+                 "recall": hits / exact_ids.size, "ms_per_query": 1000 * seconds / len(queries),
+                 "build_seconds": build_seconds})
+  return pd.DataFrame(rows)
+
+
+def benchmark_parallel_vectorize(documents, workers=(1, 2, 4, 8), **count_params):
+  """
+  Scaling of ``parallel_count_vectorize`` from 1 to N workers.
+
+  The baseline is the serial ``CountVectorizer``; ``identical`` checks that
+  every parallel run returns exactly the same dictionary and matrix.
+  """
+  from sklearn.feature_extraction.text import CountVectorizer
+  from lsa.vectorize import parallel_count_vectorize
+
+  documents = list(documents)
+  serial = CountVectorizer(**count_params)
+  expected, serial_seconds = _timed(serial.fit_transform, documents)
+  expected_terms = serial.get_feature_names_out().tolist()
+  rows = [{"workers": "serial", "seconds": serial_seconds, "speedup": 1.0, "identical": True}]
+  for n_jobs in workers:
+    (vectorizer, counts), seconds = _timed(parallel_count_vectorize, documents, n_jobs=n_jobs,
+                                           **count_params)
+    identical = (vectorizer.get_feature_names_out().tolist() == expected_terms
+                 and counts.shape == expected.shape and (counts != expected).nnz == 0)
+    rows.append({"workers": n_jobs, "seconds": seconds, "speedup": serial_seconds / seconds,
+                 "identical": identical})
+  return pd.DataFrame(rows)
+
+
+def benchmark_tokenization(documents, ngram_ranges=((1, 1), (1, 2)), stop_words="english", repeats=2):
+  """
+  Documents per second of ``TokenizationEngine.count`` against ``CountVectorizer``.
+
+  The engine is timed on ``repeats`` passes: the first fills its lookup
+  tables, later ones find every token in them, as when a long-running job
+  vectorizes batch after batch. Only pass 1 compares like with like; a job
+  that sees each document once gets the pass 1 speedup, not the later ones.
+  ``identical`` compares each run's dictionary and matrix with
+  ``CountVectorizer``'s.
+  """
+  from sklearn.feature_extraction.text import CountVectorizer
+  from lsa.tokenization import TokenizationEngine
+
+  documents = list(documents)
+  rows = []
+  for ngram_range in ngram_ranges:
+    vectorizer = CountVectorizer(stop_words=stop_words, ngram_range=ngram_range)
+    expected, baseline_seconds = _timed(vectorizer.fit_transform, documents)
+    expected_terms = vectorizer.get_feature_names_out()
+    rows.append({"analyzer": "CountVectorizer", "ngram_range": ngram_range, "pass": 1,
+                 "seconds": baseline_seconds, "documents_per_second": len(documents) / baseline_seconds,
+                 "speedup": 1.0, "identical": True})
+    engine = TokenizationEngine(stop_words=stop_words, ngram_range=ngram_range)
+    for repeat in range(1, repeats + 1):
+      (terms, counts), seconds = _timed(engine.count, documents)
+      identical = (len(terms) == len(expected_terms) and (terms == expected_terms).all()
+                   and (counts != expected).nnz == 0)
+      rows.append({"analyzer": "TokenizationEngine", "ngram_range": ngram_range, "pass": repeat,
+                   "seconds": seconds, "documents_per_second": len(documents) / seconds,
+                   "speedup": baseline_seconds / seconds, "identical": identical})
+  return pd.DataFrame(rows)
+
+
+def benchmark_ingest(csv_path, parquet_path, spark=None, columns=("sentence", "title"), repeats=3,
+                     spark_csv_path=None, spark_parquet_path=None):
+  """
+  Load times of the body from CSV and from the Parquet data set of ``lsa.ingest``.
+
+  The single-node rows compare ``pandas.read_csv`` with ``read_body_pandas``.
+  With a ``spark`` session the notebook's ``spark.read.csv(...).toPandas()``
+  is compared with the projected Parquet read. Spark resolves paths on DBFS
+  rather than the local file system, so on Databricks pass the same files
+  as ``spark_csv_path`` and ``spark_parquet_path`` (``/tmp/body.csv`` for
+  ``/dbfs/tmp/body.csv``); they default to ``csv_path`` and ``parquet_path``.
+  """
+  from lsa import ingest
+
+  def best_of(fn):
+    return min(_timed(fn)[1] for _ in range(repeats))
+
+  rows = [
+    {"variant": "pandas.read_csv", "seconds": best_of(lambda: pd.read_csv(csv_path, dtype=str))},
+    {"variant": "parquet -> pandas (ArrowDtype)",
+     "seconds": best_of(lambda: ingest.read_body_pandas(parquet_path, columns))},
+    {"variant": "parquet -> pandas (object)",
+     "seconds": best_of(lambda: ingest.read_body_pandas(parquet_path, columns, arrow_dtypes=False))},
+  ]
+  if spark is not None:
+    spark_csv_path = spark_csv_path or csv_path
+    spark_parquet_path = spark_parquet_path or parquet_path
+    rows.append({"variant": "spark.read.csv + toPandas", "seconds": best_of(
+      lambda: spark.read.option("header", "true").csv(spark_csv_path).toPandas())})
+    rows.append({"variant": "spark.read.parquet + toPandas", "seconds": best_of(
+      lambda: ingest.load_body(spark, spark_parquet_path, columns).toPandas())})
+  return pd.DataFrame(rows)
+
+
+def benchmark_precision(documents, n_components=2, weighting="count", random_state=0, **count_params):
+  """
+  Memory per stage and accuracy of the float32 LSA against the float64 baseline.
+
+  Returns ``(memory, accuracy)``: the per-stage bytes of both runs side by
+  side, and the differences in topics, encodings and explained variance.
+  """
+  from lsa.pipeline import run_lsa
+
+  runs = {}
+  for dtype in (np.float64, np.float32):
+    runs[np.dtype(dtype).name] = run_lsa(documents, n_components=n_components, weighting=weighting,
+                                         dtype=dtype, random_state=random_state, **count_params)
+  baseline, compact = runs["float64"], runs["float32"]
+
+  memory = baseline.memory.merge(compact.memory, on="stage", suffixes=("_float64", "_float32"))
+  memory["ratio"] = memory["bytes_float32"] / memory["bytes_float64"]
+
+  scale = np.abs(baseline.lsa).max() or 1.0
+  accuracy = pd.DataFrame([{
+    "subspace_error": _subspace_error(compact.svd.components_.astype(np.float64), baseline.svd.components_),
+    "max_encoding_error": float(np.abs(compact.lsa - baseline.lsa).max() / scale),
+    "max_explained_variance_ratio_error": float(np.abs(
+      compact.svd.explained_variance_ratio_ - baseline.svd.explained_variance_ratio_).max())}])
+  return memory, accuracy
+
+
+def benchmark_spark_scoring(spark, df, vectorizer, components, text_col="sentence", idf=None):
+  """
+  Throughput of ``add_topic_columns`` against collecting ``df`` to the driver.
+
+  Scoring is forced with Spark's ``noop`` sink so no output is written.
+  Throughput is given in rows/sec and in rows/sec per core, with the number
+  of cores taken from ``spark.sparkContext.defaultParallelism``.
+  """
+  from lsa.spark_lsa import add_topic_columns
+
+  df = df.select(text_col).cache()
+  n_rows = df.count()
+  cores = spark.sparkContext.defaultParallelism
+
+  def collect_and_score():
+    texts = df.toPandas()[text_col].fillna("")
+    return vectorizer.transform(texts) @ components.T
+
+  def distributed():
+    add_topic_columns(df, vectorizer, components, text_col=text_col, idf=idf).write.format("noop").mode(
+      "overwrite").save()
+
+  rows = []
+  for variant, fn, n_cores in (("toPandas + transform on the driver", collect_and_score, 1),
+                               ("add_topic_columns pandas UDF", distributed, cores)):
+    _, seconds = _timed(fn)
+    rows.append({"variant": variant, "rows": n_rows, "cores": n_cores, "seconds": seconds,
+                 "rows_per_second": n_rows / seconds, "rows_per_second_per_core": n_rows / seconds / n_cores})
+  df.unpersist()
+  return pd.DataFrame(rows)
+
+
+def _pseudo_words(n_words):
+  # Distinct lower-case tokens of at least two letters, so the default
+  # CountVectorizer analyzer keeps them and no stop word is generated.
+  letters = np.array(list("abcdefghijklmnopqrstuvwxyz"))
+  words = []
+  for rank in range(n_words):
+    digits = []
+    rank += 26 * 27
+    while rank:
+      rank, digit = divmod(rank, 26)
+      digits.append(letters[digit])
+    words.append("q" + "".join(digits))
+  return np.asarray(words, dtype=object)
+
+
+def synthetic_corpus(n_documents, vocab_size=50000, words_per_document=12, zipf_a=1.1, n_classes=2,
+                     class_share=0.5, seed=0, chunk_size=100000):
+  """
+  A reproducible body of ``n_documents`` with a Zipfian vocabulary.
+
+  Word ranks follow a Zipf law with exponent ``zipf_a`` over ``vocab_size``
+  words. A ``class_share`` of the words of every document comes from a
+  ranking specific to its class, so the classes have distinct topics like
+  the two poems. Returns ``(sentences, labels)``.
+  """
+  rng = np.random.default_rng(seed)
+  words = _pseudo_words(vocab_size)
+  probabilities = 1.0 / np.arange(1, vocab_size + 1) ** zipf_a
+  probabilities /= probabilities.sum()
+  class_rankings = [rng.permutation(vocab_size) for _ in range(n_classes)]
+
+  labels = rng.integers(0, n_classes, n_documents)
+  n_class_words = int(round(words_per_document * class_share))
+  sentences = []
+  for start in range(0, n_documents, chunk_size):
+    chunk_labels = labels[start:start + chunk_size]
+    ranks = rng.choice(vocab_size, size=(len(chunk_labels), words_per_document), p=probabilities)
+    for c, ranking in enumerate(class_rankings):
+      in_class = chunk_labels == c
+      ranks[in_class, :n_class_words] = ranking[ranks[in_class, :n_class_words]]
+    sentences.extend(" ".join(row) for row in words[ranks])
+  return sentences, labels
+
+
+def _render_plot(topic_encoded_df, labels):
+  import io
+  import matplotlib
+  matplotlib.use("Agg")
+  import matplotlib.pyplot as plt
+  from lsa.plotting import density_scatter
+
+  fig, ax = plt.subplots()
+  density_scatter(ax, topic_encoded_df["topic_1"].values, topic_encoded_df["topic_2"].values, labels)
+  ax.legend()
+  fig.savefig(io.BytesIO(), format="png")
+  plt.close(fig)
+
+
+def run_benchmark_suite(scales=(10 ** 3, 10 ** 4, 10 ** 5), n_components=2, vocab_size=50000, seed=0,
+                        plot_max_documents=None, n_top_terms=10):
+  """
+  Time and memory-profile every stage of the notebook at each corpus scale.
+
+  The stages are corpus generation, count and TF-IDF vectorization, the SVD,
+  the interpretation of the encoding matrix and plotting (skipped above
+  ``plot_max_documents`` when given). Returns one row per scale and stage.
+  """
+  from sklearn.decomposition import TruncatedSVD
+  from sklearn.feature_extraction.text import CountVectorizer
+  from lsa.profiling import PipelineProfiler
+  from lsa.topics import top_terms
+  from lsa.vectorize import tfidf_from_counts
+
+  # Import matplotlib up front so its import time is not charged to the first plot.
+  _render_plot(pd.DataFrame({"topic_1": [0.0], "topic_2": [0.0]}), np.zeros(1))
+  rows = []
+  for n_documents in scales:
+    n_documents = int(n_documents)
+    profiler = PipelineProfiler("suite-{}".format(n_documents))
+    with profiler.stage("generate"):
+      sentences, labels = synthetic_corpus(n_documents, vocab_size=vocab_size, seed=seed)
+    with profiler.stage("vectorize count") as stage:
+      vectorizer = CountVectorizer(min_df=1, stop_words="english")
+      counts = stage.matrix("counts", vectorizer.fit_transform(sentences))
+    with profiler.stage("vectorize tfidf") as stage:
+      stage.matrix("tfidf", tfidf_from_counts(counts))
+    with profiler.stage("svd") as stage:
+      svd = TruncatedSVD(n_components=n_components, random_state=seed)
+      lsa = stage.matrix("lsa", svd.fit_transform(counts))
+    with profiler.stage("interpret"):
+      top_terms(svd.components_, vectorizer.get_feature_names_out(), n_terms=n_top_terms)
+    if plot_max_documents is None or n_documents <= plot_max_documents:
+      with profiler.stage("plot"):
+        _render_plot(pd.DataFrame(lsa[:, :2], columns=["topic_1", "topic_2"]), labels)
+    del sentences, counts, lsa
+
+    summary = profiler.summary()
+    summary.insert(0, "n_documents", n_documents)
+    rows.append(summary)
+  return pd.concat(rows, ignore_index=True)
+
+
+def environment():
+  """What a benchmark result depends on besides the code."""
+  import scipy
+  import sklearn
+  return {"python": platform.python_version(), "numpy": np.__version__, "scipy": scipy.__version__,
+          "sklearn": sklearn.__version__, "pandas": pd.__version__, "machine": platform.machine(),
+          "processor": platform.processor(), "cpus": os.cpu_count(), "node": platform.node()}
+
+
+def save_results(results, path):
+  """Write suite ``results`` with the environment and a timestamp to ``path`` as JSON."""
+  with open(path, "w") as handle:
+    json.dump({"created": datetime.datetime.now().isoformat(), "environment": environment(),
+               "results": json.loads(results.to_json(orient="records"))}, handle, indent=2)
+
+
+def load_results(path):
+  with open(path) as handle:
+    return pd.DataFrame(json.load(handle)["results"])
+
+
+def compare_results(baseline, current, metric="wall_s", tolerance=0.2):
+  """
+  Join two suite results on scale and stage and flag regressions.
+
+  A stage regressed when ``metric`` grew by more than ``tolerance`` (20% by
+  default) relative to ``baseline``. Either argument may be a path.
+  """
+  if isinstance(baseline, str):
+    baseline = load_results(baseline)
+  if isinstance(current, str):
+    current = load_results(current)
+  keys = ["n_documents", "stage"]
+  comparison = baseline[keys + [metric]].merge(current[keys + [metric]], on=keys,
+                                               suffixes=("_baseline", "_current"))
+  comparison["ratio"] = comparison[metric + "_current"] / comparison[metric + "_baseline"]
+  comparison["regression"] = comparison["ratio"] > 1 + tolerance
+  return comparison
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description="Benchmark the LSA notebook's stages on synthetic corpora.")
+  parser.add_argument("--scales", type=float, nargs="+", default=[1e3, 1e4, 1e5],
+                      help="numbers of documents, up to 1e7")
+  parser.add_argument("--n-components", type=int, default=2)
+  parser.add_argument("--vocab-size", type=int, default=50000)
+  parser.add_argument("--seed", type=int, default=0)
+  parser.add_argument("--output", help="write the results to this JSON file")
+  parser.add_argument("--baseline", help="compare against the results in this JSON file")
+  parser.add_argument("--tolerance", type=float, default=0.2)
+  args = parser.parse_args(argv)
+
+  results = run_benchmark_suite(scales=[int(scale) for scale in args.scales], n_components=args.n_components,
+                                vocab_size=args.vocab_size, seed=args.seed)
+  with pd.option_context("display.width", 200, "display.max_columns", 20):
+    print(results.to_string(index=False))
+    if args.output:
+      save_results(results, args.output)
+    if args.baseline:
+      comparison = compare_results(args.baseline, results, tolerance=args.tolerance)
+      print(comparison.to_string(index=False))
+      if comparison["regression"].any():
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,264 @@
+"""
+On-disk cache of fitted LSA models keyed by a fingerprint of the body.
+
+A cache entry holds the dictionary, the fitted SVD and the ``lsa``
+embeddings of one fit. Matrices are stored as ``.npy`` files and loaded
+memory-mapped, so a hit costs a lookup rather than a refit. The sha256 of
+every input file is remembered with its size and modification time, and only
+files that changed since are read and hashed again. The cache is capped in
+bytes and evicts least recently used entries.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+
+import numpy as np
+
+try:
+  import fcntl
+except ImportError:  # Windows
+  fcntl = None
+
+CachedLSA = namedtuple("CachedLSA", ["dictionary", "components", "lsa", "hit", "svd"])
+
+_INDEX = "index.json"
+_DICTIONARY = "dictionary.json"
+_LOCK = "index.lock"
+_DIGESTS = "digests.json"
+
+# The arrays of a fitted TruncatedSVD kept in an entry, besides the embeddings.
+_SVD_ARRAYS = ("components", "singular_values", "explained_variance", "explained_variance_ratio")
+
+
+def _file_sha256(path, block_size):
+  digest = hashlib.sha256()
+  with open(path, "rb") as handle:
+    for block in iter(lambda: handle.read(block_size), b""):
+      digest.update(block)
+  return digest.hexdigest()
+
+
+def fingerprint(path, params=None, block_size=1 << 20, known=None):
+  """
+  sha256 of the contents of ``path`` and of the JSON-encoded ``params``.
+
+  A directory, e.g. a Parquet data set, is hashed from the relative path and
+  the sha256 of every file, in sorted order. ``known`` maps absolute file
+  paths to the ``size``, ``mtime_ns`` and ``sha256`` of an earlier hash: a
+  file whose size and modification time still match is not read again, and
+  files that are read are added to it.
+  """
+  known = {} if known is None else known
+  if os.path.isdir(path):
+    files = sorted(os.path.relpath(os.path.join(directory, name), path)
+                   for directory, _, names in os.walk(path) for name in names)
+  else:
+    files = [None]
+  digest = hashlib.sha256()
+  for name in files:
+    file_path = os.path.abspath(path if name is None else os.path.join(path, name))
+    stat = os.stat(file_path)
+    entry = known.get(file_path)
+    if not entry or entry["size"] != stat.st_size or entry["mtime_ns"] != stat.st_mtime_ns:
+      entry = known[file_path] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns,
+                                  "sha256": _file_sha256(file_path, block_size)}
+    if name is not None:
+      digest.update(name.encode("utf-8"))
+    digest.update(entry["sha256"].encode("ascii"))
+  digest.update(json.dumps(params or {}, sort_keys=True, default=str).encode("utf-8"))
+  return digest.hexdigest()
+
+
+def fitted_svd(arrays):
+  """A fitted ``TruncatedSVD`` from the arrays of a cache entry, ready for ``transform``."""
+  from sklearn.decomposition import TruncatedSVD
+
+  components = arrays["components"]
+  svd = TruncatedSVD(n_components=components.shape[0])
+  for name in _SVD_ARRAYS:
+    setattr(svd, name + "_", arrays[name])
+  svd.n_features_in_ = components.shape[1]
+  return svd
+
+
+class ModelCache:
+  """
+  LRU cache of fitted models under ``root``, capped at ``max_bytes``.
+
+  The cache is safe to share between notebook runs and, where ``fcntl`` is
+  available, between processes writing at the same time: every update of the
+  index holds an exclusive lock on ``index.lock``.
+  """
+
+  def __init__(self, root, max_bytes=1 << 30):
+    self.root = root
+    self.max_bytes = max_bytes
+    os.makedirs(root, exist_ok=True)
+
+  def _index_path(self):
+    return os.path.join(self.root, _INDEX)
+
+  def _read_index(self):
+    try:
+      with open(self._index_path()) as handle:
+        return json.load(handle)
+    except (OSError, ValueError):
+      return {}
+
+  @contextmanager
+  def _locked(self):
+    if fcntl is None:
+      yield
+      return
+    with open(os.path.join(self.root, _LOCK), "a") as handle:
+      fcntl.flock(handle, fcntl.LOCK_EX)
+      try:
+        yield
+      finally:
+        fcntl.flock(handle, fcntl.LOCK_UN)
+
+  def _write_index(self, index):
+    fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix=".json")
+    with os.fdopen(fd, "w") as handle:
+      json.dump(index, handle)
+    os.replace(tmp_path, self._index_path())
+
+  def __contains__(self, key):
+    return key in self._read_index()
+
+  def key(self, path, params=None):
+    """The ``fingerprint`` of ``path`` and ``params``, hashing only files changed since the last call."""
+    digests_path = os.path.join(self.root, _DIGESTS)
+    try:
+      with open(digests_path) as handle:
+        known = json.load(handle)
+    except (OSError, ValueError):
+      known = {}
+    before = json.dumps(known, sort_keys=True)
+    key = fingerprint(path, params, known=known)
+    if json.dumps(known, sort_keys=True) != before:
+      with self._locked():
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix=".json")
+        with os.fdopen(fd, "w") as handle:
+          json.dump(known, handle)
+        os.replace(tmp_path, digests_path)
+    return key
+
+  def get(self, key):
+    """
+    Return ``(dictionary, arrays)`` for ``key`` or ``None`` on a miss.
+
+    ``arrays`` maps names to read-only memory-mapped NumPy arrays.
+    """
+    with self._locked():
+      index = self._read_index()
+      if key not in index:
+        return None
+      entry_dir = os.path.join(self.root, key)
+      try:
+        with open(os.path.join(entry_dir, _DICTIONARY)) as handle:
+          dictionary = json.load(handle)
+        arrays = {name: np.load(os.path.join(entry_dir, name + ".npy"), mmap_mode="r")
+                  for name in index[key]["arrays"]}
+      except (OSError, ValueError):
+        # A partially deleted entry is a miss, not an error.
+        del index[key]
+        self._write_index(index)
+        return None
+      index[key]["last_access"] = time.time()
+      self._write_index(index)
+    return dictionary, arrays
+
+  def put(self, key, dictionary, arrays):
+    """Store ``dictionary`` and the named ``arrays`` under ``key``, then evict."""
+    staging_dir = tempfile.mkdtemp(dir=self.root, prefix=".staging-")
+    with open(os.path.join(staging_dir, _DICTIONARY), "w") as handle:
+      json.dump(list(dictionary), handle)
+    for name, array in arrays.items():
+      np.save(os.path.join(staging_dir, name + ".npy"), np.asarray(array))
+    size = sum(os.path.getsize(os.path.join(staging_dir, name)) for name in os.listdir(staging_dir))
+
+    entry_dir = os.path.join(self.root, key)
+    with self._locked():
+      shutil.rmtree(entry_dir, ignore_errors=True)
+      os.replace(staging_dir, entry_dir)
+      index = self._read_index()
+      index[key] = {"bytes": size, "arrays": sorted(arrays), "last_access": time.time()}
+      self._evict(index, keep=key)
+      self._write_index(index)
+
+  def _evict(self, index, keep=None):
+    total = sum(entry["bytes"] for entry in index.values())
+    for key in sorted(index, key=lambda k: index[k]["last_access"]):
+      if total <= self.max_bytes:
+        break
+      if key == keep:
+        continue
+      total -= index.pop(key)["bytes"]
+      shutil.rmtree(os.path.join(self.root, key), ignore_errors=True)
+
+  def clear(self):
+    with self._locked():
+      for key in self._read_index():
+        shutil.rmtree(os.path.join(self.root, key), ignore_errors=True)
+      self._write_index({})
+
+
+def read_documents(path, text_col="sentence"):
+  """The non-null ``text_col`` of the CSV file or Parquet data set at ``path``, in file order."""
+  import pandas as pd
+
+  if os.path.isdir(path) or path.endswith(".parquet"):
+    from lsa.ingest import read_body_pandas
+    body = read_body_pandas(path, columns=[text_col], arrow_dtypes=False)
+  else:
+    body = pd.read_csv(path, usecols=[text_col])
+  return body[text_col].dropna().reset_index(drop=True)
+
+
+def cached_lsa(cache, path, documents=None, weighting="count", n_components=2, random_state=None,
+               text_col="sentence", selection=None, **count_params):
+  """
+  The notebook's vectorize + SVD fit, served from ``cache`` when possible.
+
+  ``path`` is the file the body was read from and is what gets fingerprinted
+  together with the parameters; the file is only hashed again once its size
+  or modification time changes. By default the documents are the non-null
+  ``text_col`` of ``path`` as returned by ``read_documents``, read only on a
+  miss. Documents selected some other way, e.g. a filtered DataFrame column
+  or a zero-argument callable returning one, must be passed as ``documents``
+  together with a ``selection``: a JSON-serializable description of how
+  they were derived from ``path``, which becomes part of the key. The
+  ``svd`` of the result is a fitted ``TruncatedSVD``, also on a hit.
+  """
+  if documents is not None and selection is None:
+    raise ValueError("documents other than the text_col of path need a selection describing them")
+  params = {"weighting": weighting, "n_components": n_components, "random_state": random_state,
+            "text_col": text_col, "selection": selection, "count_params": count_params}
+  key = cache.key(path, params)
+  entry = cache.get(key)
+  if entry is not None and all(name in entry[1] for name in _SVD_ARRAYS):
+    dictionary, arrays = entry
+    return CachedLSA(dictionary, arrays["components"], arrays["lsa"], True, fitted_svd(arrays))
+
+  from sklearn.decomposition import TruncatedSVD
+  from lsa.vectorize import fused_count_tfidf
+
+  if documents is None:
+    documents = read_documents(path, text_col)
+  elif callable(documents):
+    documents = documents()
+  document_terms = fused_count_tfidf(documents, **count_params)
+  matrix = document_terms.tfidf if weighting == "tfidf" else document_terms.counts
+  svd = TruncatedSVD(n_components=n_components, random_state=random_state)
+  lsa = svd.fit_transform(matrix)
+  dictionary = document_terms.vectorizer.get_feature_names_out().tolist()
+  arrays = {name: getattr(svd, name + "_") for name in _SVD_ARRAYS}
+  cache.put(key, dictionary, dict(arrays, lsa=lsa))
+  return CachedLSA(dictionary, svd.components_, lsa, False, svd)
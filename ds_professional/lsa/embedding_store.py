@@ -0,0 +1,167 @@
+"""
+Compact on-disk storage for topic-encoded documents.
+
+A store is a directory holding
+
+- ``embeddings.f32``: the n x k topic encodings as a row-major float32 matrix,
+- ``text.offsets`` / ``text.heap``: the document text as n + 1 int64 offsets
+  into one buffer of UTF-8 bytes,
+- ``<label>.npy``: one file per label column, e.g. ``Is_Poe``, as a plain
+  (memory-mappable) NumPy array,
+- ``meta.json``: the shapes and column names.
+
+Everything is opened memory-mapped, so readers get NumPy views of the files
+without copying them into memory. ``EmbeddingStore.iloc`` returns pandas
+DataFrames for the selected rows only.
+"""
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from lsa.topics import topic_columns
+
+_META = "meta.json"
+_EMBEDDINGS = "embeddings.f32"
+_OFFSETS = "text.offsets"
+_HEAP = "text.heap"
+
+
+def _label_array(name, values):
+  # Labels are memory-mapped by the reader, which rules out object arrays:
+  # strings become fixed-width unicode, anything else is refused here rather
+  # than when the store is opened.
+  values = np.asarray(values)
+  if values.dtype.kind == "O":
+    if not all(isinstance(value, str) for value in values):
+      kinds = sorted({type(value).__name__ for value in values if not isinstance(value, str)})
+      raise TypeError("label {!r} holds Python objects ({}); convert it to numbers, booleans or strings"
+                      .format(name, ", ".join(kinds)))
+    values = values.astype(str)
+  return values
+
+
+def write_embedding_store(path, embeddings, texts, labels=None, columns=None, text_col="sentence",
+                          chunk_size=65536):
+  """
+  Write the topic encodings ``embeddings`` and their ``texts`` to ``path``.
+
+  ``labels`` maps label column names to arrays with one value per document;
+  string labels are stored as fixed-width unicode and other Python objects
+  (including missing values in a string column) raise ``TypeError``.
+  Rows are written in chunks of ``chunk_size`` so the float32 copy of
+  ``embeddings`` never exists in memory all at once.
+  """
+  n_rows, n_components = embeddings.shape
+  if hasattr(texts, "__len__") and len(texts) != n_rows:
+    raise ValueError("got {} texts for {} embeddings".format(len(texts), n_rows))
+  columns = list(columns or topic_columns(n_components))
+  labels = labels or {}
+  os.makedirs(path, exist_ok=True)
+
+  with open(os.path.join(path, _EMBEDDINGS), "wb") as handle:
+    for start in range(0, n_rows, chunk_size):
+      np.ascontiguousarray(embeddings[start:start + chunk_size], dtype=np.float32).tofile(handle)
+
+  offsets = np.empty(n_rows + 1, dtype=np.int64)
+  offsets[0] = 0
+  n_texts = 0
+  with open(os.path.join(path, _HEAP), "wb") as handle:
+    for n_texts, text in enumerate(texts, start=1):
+      if n_texts > n_rows:
+        raise ValueError("got more texts than the {} embeddings".format(n_rows))
+      encoded = ("" if text is None else str(text)).encode("utf-8")
+      handle.write(encoded)
+      offsets[n_texts] = offsets[n_texts - 1] + len(encoded)
+  if n_texts != n_rows:
+    raise ValueError("got {} texts for {} embeddings".format(n_texts, n_rows))
+  offsets.tofile(os.path.join(path, _OFFSETS))
+
+  for name, values in labels.items():
+    values = _label_array(name, values)
+    if len(values) != n_rows:
+      raise ValueError("label {!r} has {} values for {} embeddings".format(name, len(values), n_rows))
+    np.save(os.path.join(path, name + ".npy"), values)
+
+  with open(os.path.join(path, _META), "w") as handle:
+    json.dump({"n_rows": n_rows, "columns": columns, "text_col": text_col, "labels": list(labels)},
+              handle)
+  return EmbeddingStore(path)
+
+
+class _ILocIndexer:
+
+  def __init__(self, store):
+    self._store = store
+
+  def __getitem__(self, rows):
+    return self._store.to_pandas(rows)
+
+
+class EmbeddingStore:
+  """Read-only, memory-mapped view of a store written by ``write_embedding_store``."""
+
+  def __init__(self, path):
+    self.path = path
+    with open(os.path.join(path, _META)) as handle:
+      meta = json.load(handle)
+    self.columns = meta["columns"]
+    self.text_col = meta["text_col"]
+    n_rows = meta["n_rows"]
+    shape = (n_rows, len(self.columns))
+    if n_rows:
+      self.embeddings = np.memmap(os.path.join(path, _EMBEDDINGS), dtype=np.float32, mode="r",
+                                  shape=shape)
+    else:
+      self.embeddings = np.empty(shape, dtype=np.float32)
+    self.offsets = np.memmap(os.path.join(path, _OFFSETS), dtype=np.int64, mode="r")
+    self._heap = (np.memmap(os.path.join(path, _HEAP), dtype=np.uint8, mode="r")
+                  if self.offsets[-1] else np.empty(0, dtype=np.uint8))
+    self.labels = {name: np.load(os.path.join(path, name + ".npy"), mmap_mode="r")
+                   for name in meta["labels"]}
+    self.iloc = _ILocIndexer(self)
+
+  def __len__(self):
+    return self.embeddings.shape[0]
+
+  def text(self, row):
+    """The text of document ``row``."""
+    return self._heap[self.offsets[row]:self.offsets[row + 1]].tobytes().decode("utf-8")
+
+  def texts(self, rows):
+    return [self.text(row) for row in rows]
+
+  def _positions(self, rows):
+    # A slice stays a slice, so the memory-mapped arrays are sliced as views;
+    # anything else becomes an array of non-negative positions.
+    n_rows = len(self)
+    if rows is None:
+      rows = slice(None)
+    if isinstance(rows, slice):
+      return rows, pd.RangeIndex(*rows.indices(n_rows))
+    positions = np.asarray(rows)
+    if positions.dtype == bool:
+      if positions.shape != (n_rows,):
+        raise IndexError("boolean index of length {} for {} rows".format(len(positions), n_rows))
+      positions = np.flatnonzero(positions)
+    positions = np.atleast_1d(positions).astype(np.int64, copy=False)
+    if len(positions) and (positions.min() < -n_rows or positions.max() >= n_rows):
+      raise IndexError("row index out of range for {} rows".format(n_rows))
+    positions = np.where(positions < 0, positions + n_rows, positions)
+    return positions, pd.Index(positions)
+
+  def to_pandas(self, rows=None):
+    """
+    A DataFrame shaped like the notebook's ``topic_encoded_df``.
+
+    ``rows`` is a position, a slice, a list or array of positions, a boolean
+    mask or a pandas Index; only those rows are read from disk.
+    """
+    rows, index = self._positions(rows)
+    frame = pd.DataFrame(self.embeddings[rows], columns=self.columns, index=index)
+    frame[self.text_col] = self.texts(index)
+    for name, values in self.labels.items():
+      frame[name] = values[rows]
+    return frame
@@ -0,0 +1,276 @@
+"""
+Cached, resumable downloads of the notebook's data sets.
+
+Downloads land in a content-addressed cache (``blobs/<sha256>``) and the
+cache remembers the ETag and Last-Modified of every URL, so later runs only
+make a conditional request, or no request at all when the expected sha256 is
+given. Interrupted downloads resume with a ranged request guarded by the
+ETag or Last-Modified of the partial file, and the target path is only ever
+replaced atomically with a verified copy. When the server cannot be reached
+the cached copy is used and the result says so with ``offline``.
+"""
+
+import hashlib
+import http.client
+import json
+import os
+import shutil
+import tempfile
+import time
+import urllib.error
+import urllib.request
+import warnings
+from collections import namedtuple
+
+FetchResult = namedtuple("FetchResult", ["path", "sha256", "cache_hit", "seconds", "bytes_downloaded", "offline"],
+                         defaults=(False,))
+
+DEFAULT_CACHE_DIR = os.path.join(tempfile.gettempdir(), "lsa_downloads")
+
+
+def file_sha256(path, block_size=1 << 20):
+  digest = hashlib.sha256()
+  with open(path, "rb") as handle:
+    for block in iter(lambda: handle.read(block_size), b""):
+      digest.update(block)
+  return digest.hexdigest()
+
+
+class DownloadCache:
+  """Content-addressed store of downloaded files under ``root``."""
+
+  def __init__(self, root=DEFAULT_CACHE_DIR):
+    self.root = root
+    for name in ("blobs", "partial"):
+      os.makedirs(os.path.join(root, name), exist_ok=True)
+
+  def blob_path(self, sha256):
+    return os.path.join(self.root, "blobs", sha256)
+
+  def partial_path(self, url):
+    return os.path.join(self.root, "partial", hashlib.sha1(url.encode("utf-8")).hexdigest() + ".part")
+
+  def _index_path(self):
+    return os.path.join(self.root, "urls.json")
+
+  def lookup(self, url):
+    """The cached entry of ``url`` if its blob is still present, else ``None``."""
+    try:
+      with open(self._index_path()) as handle:
+        entry = json.load(handle).get(url)
+    except (OSError, ValueError):
+      return None
+    if entry and os.path.exists(self.blob_path(entry["sha256"])):
+      return entry
+    return None
+
+  def _placements_path(self):
+    return os.path.join(self.root, "placements.json")
+
+  def _read_placements(self):
+    try:
+      with open(self._placements_path()) as handle:
+        return json.load(handle)
+    except (OSError, ValueError):
+      return {}
+
+  def is_placed(self, dest, sha256):
+    """True if ``dest`` is still the copy of blob ``sha256`` placed there by ``fetch``."""
+    placement = self._read_placements().get(os.path.abspath(dest))
+    try:
+      stat = os.stat(dest)
+    except OSError:
+      return False
+    return placement == {"sha256": sha256, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+  def record_placement(self, dest, sha256):
+    stat = os.stat(dest)
+    placements = self._read_placements()
+    placements[os.path.abspath(dest)] = {"sha256": sha256, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+    fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix=".json")
+    with os.fdopen(fd, "w") as handle:
+      json.dump(placements, handle)
+    os.replace(tmp_path, self._placements_path())
+
+  def record(self, url, entry):
+    try:
+      with open(self._index_path()) as handle:
+        index = json.load(handle)
+    except (OSError, ValueError):
+      index = {}
+    index[url] = entry
+    fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix=".json")
+    with os.fdopen(fd, "w") as handle:
+      json.dump(index, handle)
+    os.replace(tmp_path, self._index_path())
+
+
+def _open(url, headers, timeout):
+  return urllib.request.urlopen(urllib.request.Request(url, headers=headers), timeout=timeout)
+
+
+# Outcomes of _revalidate other than a fresh response to download.
+_CURRENT = "current"
+_OFFLINE = "offline"
+
+# Failures to reach the server, as opposed to answers from it: DNS and
+# connection errors (URLError), timeouts and connections dropped mid-response.
+_NETWORK_ERRORS = (urllib.error.URLError, TimeoutError, ConnectionError, http.client.HTTPException)
+
+
+def _revalidate(url, entry, timeout):
+  # _CURRENT if the server confirms the cached copy (304), _OFFLINE if it
+  # cannot be reached, otherwise the open response with the new version
+  # (or None when the entry has no validator to send).
+  headers = {}
+  if entry.get("etag"):
+    headers["If-None-Match"] = entry["etag"]
+  if entry.get("last_modified"):
+    headers["If-Modified-Since"] = entry["last_modified"]
+  if not headers:
+    return None
+  try:
+    response = _open(url, headers, timeout)
+  except urllib.error.HTTPError as error:
+    if error.code == 304:
+      return _CURRENT
+    raise
+  except _NETWORK_ERRORS as error:
+    warnings.warn("could not revalidate {} ({}); using the cached copy".format(url, error))
+    return _OFFLINE
+  if response.status == 304:
+    response.close()
+    return _CURRENT
+  return response
+
+
+def _range_validator(headers):
+  # If-Range takes a strong ETag or a Last-Modified date.
+  etag = headers.get("ETag")
+  if etag and not etag.startswith("W/"):
+    return etag
+  return headers.get("Last-Modified")
+
+
+def _discard(*paths):
+  for path in paths:
+    if os.path.exists(path):
+      os.remove(path)
+
+
+def _download(url, cache, timeout, chunk_size, response=None):
+  """
+  Download ``url`` into the partial file, resuming it when possible.
+
+  ``response`` is an already open full (200) response to read instead of
+  making a new request.
+  """
+  part_path = cache.partial_path(url)
+  validator_path = part_path + ".validator"
+  if response is None:
+    offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    headers = {}
+    if offset:
+      try:
+        with open(validator_path) as handle:
+          validator = handle.read()
+      except OSError:
+        validator = None
+      if validator:
+        # If-Range makes the server send the whole resource when it changed
+        # since the partial file was started.
+        headers["Range"] = "bytes={}-".format(offset)
+        headers["If-Range"] = validator
+      else:
+        # Without a validator a changed resource would be spliced onto the
+        # stale prefix: start over.
+        _discard(part_path, validator_path)
+    try:
+      response = _open(url, headers, timeout)
+    except urllib.error.HTTPError as error:
+      if error.code != 416:
+        raise
+      # The partial file is no prefix of the current resource: start over.
+      _discard(part_path, validator_path)
+      return _download(url, cache, timeout, chunk_size)
+
+  downloaded = 0
+  with response:
+    validator = _range_validator(response.headers)
+    if validator:
+      with open(validator_path, "w") as handle:
+        handle.write(validator)
+    else:
+      _discard(validator_path)
+    mode = "ab" if response.status == 206 else "wb"
+    with open(part_path, mode) as handle:
+      for chunk in iter(lambda: response.read(chunk_size), b""):
+        handle.write(chunk)
+        downloaded += len(chunk)
+    entry = {"etag": response.headers.get("ETag"), "last_modified": response.headers.get("Last-Modified")}
+  _discard(validator_path)
+  return part_path, entry, downloaded
+
+
+def _place(blob_path, dest):
+  # Copy next to ``dest`` first, then rename over it, so readers of ``dest``
+  # never see a partially written file.
+  dest_dir = os.path.dirname(os.path.abspath(dest))
+  os.makedirs(dest_dir, exist_ok=True)
+  fd, tmp_path = tempfile.mkstemp(dir=dest_dir, prefix=".fetch-")
+  os.close(fd)
+  try:
+    shutil.copyfile(blob_path, tmp_path)
+    os.replace(tmp_path, dest)
+  except BaseException:
+    if os.path.exists(tmp_path):
+      os.remove(tmp_path)
+    raise
+
+
+def fetch(url, dest, sha256=None, cache_dir=DEFAULT_CACHE_DIR, revalidate=True, timeout=60,
+          chunk_size=1 << 20):
+  """
+  Make ``dest`` a verified copy of ``url``, downloading only when needed.
+
+  With ``sha256`` given the cached copy is trusted without contacting the
+  server and a download that does not match raises ``IOError``. Otherwise a
+  cached copy is revalidated with its ETag / Last-Modified unless
+  ``revalidate=False``; if the server cannot be reached the cached copy is
+  used with a warning, and ``offline`` is set in the result.
+  """
+  start = time.perf_counter()
+  cache = DownloadCache(cache_dir)
+  entry = cache.lookup(url)
+
+  cache_hit = offline = False
+  response = None
+  if sha256 is not None:
+    # Content addressing: any earlier download with this digest will do.
+    cache_hit = os.path.exists(cache.blob_path(sha256))
+    entry = dict(entry or {}, sha256=sha256)
+  elif entry is not None:
+    outcome = _revalidate(url, entry, timeout) if revalidate else _CURRENT
+    if outcome in (_CURRENT, _OFFLINE):
+      cache_hit, offline = True, outcome == _OFFLINE
+    else:
+      # A changed resource comes back as a 200: download it from this response.
+      response = outcome
+
+  downloaded = 0
+  if not cache_hit:
+    part_path, entry, downloaded = _download(url, cache, timeout, chunk_size, response=response)
+    digest = file_sha256(part_path)
+    if sha256 is not None and digest != sha256:
+      os.remove(part_path)
+      raise IOError("sha256 of {} is {}, expected {}".format(url, digest, sha256))
+    os.replace(part_path, cache.blob_path(digest))
+    entry = dict(entry, sha256=digest, size=os.path.getsize(cache.blob_path(digest)))
+    cache.record(url, entry)
+
+  # Copying the blob costs as much as reading it: skip it when dest is
+  # unchanged since this cache last placed the same blob there.
+  if not cache.is_placed(dest, entry["sha256"]):
+    _place(cache.blob_path(entry["sha256"]), dest)
+    cache.record_placement(dest, entry["sha256"])
+  return FetchResult(dest, entry["sha256"], cache_hit, time.perf_counter() - start, downloaded, offline)
@@ -0,0 +1,244 @@
+"""
+TF-IDF for a body that only ever grows.
+
+``IncrementalTfidf`` keeps the term -> column mapping, the document
+frequency of every term and the count matrix of the documents seen so far.
+``append`` tokenizes only the new documents: new terms get the next free
+columns, so the columns of old documents never move, and the document
+frequencies are bumped by the new rows. The TF-IDF matrix is not stored;
+it is rescaled from the counts with the current idf the first time it is
+read after an append.
+
+``save`` writes to a directory and ``load`` reads it back. A directory
+belongs to one body: saving into a directory that holds another state
+raises, unless the instance was loaded from it or ``overwrite=True``
+replaces the old state. Every save only
+adds a file of new terms and a file of new rows to the directory, plus the
+document frequencies, which take one number per term; keeping the state on
+disk costs time proportional to the new data and the dictionary. ``load``
+reads the dictionary and the document frequencies only: the files of rows
+are read the first time ``counts`` or ``tfidf`` is, so appending to a large
+saved body and transforming new documents never read it back.
+"""
+
+import glob
+import json
+import os
+
+import numpy as np
+import scipy.sparse as sp
+from sklearn.feature_extraction.text import CountVectorizer
+
+from lsa.streaming import _stack_csr
+from lsa.vectorize import _counts_dtype, _vectorize_shard, compact_indices, tfidf_from_counts
+
+_STATE_FILE = "state.json"
+
+
+def _json_params(count_params):
+  params = dict(count_params)
+  if "dtype" in params:
+    params["dtype"] = np.dtype(params["dtype"]).name
+  if isinstance(params.get("stop_words"), (set, frozenset)):
+    params["stop_words"] = sorted(params["stop_words"])
+  return params
+
+
+class IncrementalTfidf:
+  """
+  Vocabulary, document frequencies and counts of an append-only body.
+
+  ``count_params`` go to ``CountVectorizer`` (e.g. ``stop_words='english'``)
+  except ``min_df``, ``max_df`` and ``max_features``: the dictionary keeps
+  every term, since a rare term today may be frequent tomorrow. The TF-IDF
+  options are those of ``TfidfVectorizer``.
+  """
+
+  def __init__(self, norm="l2", smooth_idf=True, sublinear_tf=False, **count_params):
+    self.norm = norm
+    self.smooth_idf = smooth_idf
+    self.sublinear_tf = sublinear_tf
+    self.count_params = count_params
+    self.vocabulary_ = {}
+    self.document_frequency_ = np.zeros(0, dtype=np.int64)
+    self.n_documents_ = 0
+    self._blocks = []
+    # Saved blocks not read yet, and their rows; they come before _blocks.
+    self._block_files = []
+    self._file_rows = 0
+    self._tfidf = None
+    # The directory the saved counters refer to, set by save and load.
+    self._store = None
+    self._saved_documents = 0
+    self._saved_terms = 0
+
+  @property
+  def n_features(self):
+    return len(self.vocabulary_)
+
+  def append(self, documents):
+    """Add ``documents`` to the body; returns their count matrix."""
+    documents = list(documents)
+    terms, block = _vectorize_shard(documents, self.count_params)
+    column_map = np.fromiter((self.vocabulary_.setdefault(term, len(self.vocabulary_)) for term in terms),
+                             dtype=np.int64, count=len(terms))
+    block = sp.csr_matrix((block.data, column_map[block.indices], block.indptr),
+                          shape=(len(documents), self.n_features))
+    block.sort_indices()
+    block = compact_indices(block)
+
+    # Rows from CountVectorizer hold each term once, so counting column
+    # indices counts documents.
+    self.document_frequency_ = np.concatenate([
+      self.document_frequency_,
+      np.zeros(self.n_features - len(self.document_frequency_), dtype=np.int64)])
+    self.document_frequency_ += np.bincount(block.indices, minlength=self.n_features)
+    self.n_documents_ += len(documents)
+    self._blocks.append(block)
+    self._tfidf = None
+    return block
+
+  @property
+  def idf_(self):
+    """The ``TfidfTransformer`` idf weights of the current body."""
+    smooth = int(self.smooth_idf)
+    return np.log((self.n_documents_ + smooth) / (self.document_frequency_ + smooth)) + 1
+
+  def _read_blocks(self):
+    if self._block_files:
+      self._blocks = [sp.load_npz(name).tocsr() for name in self._block_files] + self._blocks
+      self._block_files, self._file_rows = [], 0
+    return self._blocks
+
+  @property
+  def counts(self):
+    """The count matrix of the whole body, with a column for every term seen so far."""
+    self._read_blocks()
+    if len(self._blocks) != 1 or self._blocks[0].shape[1] != self.n_features:
+      # Older blocks are narrower; stack once and keep the result.
+      self._blocks = [_stack_csr(self._blocks, self.n_features, _counts_dtype(self.count_params))]
+    return self._blocks[0]
+
+  @property
+  def tfidf(self):
+    """The TF-IDF matrix of the whole body, rescaled from ``counts`` on first read after an append."""
+    if self._tfidf is None:
+      self._tfidf = tfidf_from_counts(self.counts, idf=self.idf_, norm=self.norm,
+                                      sublinear_tf=self.sublinear_tf)
+    return self._tfidf
+
+  @property
+  def vectorizer(self):
+    """A ``CountVectorizer`` over the current dictionary, for documents not added to the body."""
+    return CountVectorizer(**dict(self.count_params, vocabulary=self.vocabulary_))
+
+  def get_feature_names_out(self):
+    return np.asarray(list(self.vocabulary_), dtype=object)
+
+  def transform(self, documents):
+    """TF-IDF of ``documents`` with the current dictionary and idf, leaving the state unchanged."""
+    return tfidf_from_counts(self.vectorizer.transform(documents), idf=self.idf_, norm=self.norm,
+                             sublinear_tf=self.sublinear_tf)
+
+  def _rows_since(self, start):
+    if start < self._file_rows:
+      self._read_blocks()
+    blocks, offset = [], self._file_rows
+    for block in self._blocks:
+      if offset + block.shape[0] > start:
+        blocks.append(block[max(start - offset, 0):])
+      offset += block.shape[0]
+    return _stack_csr(blocks, self.n_features, _counts_dtype(self.count_params))
+
+  @staticmethod
+  def exists(path):
+    """Whether ``path`` holds a state written by ``save``."""
+    return os.path.exists(os.path.join(path, _STATE_FILE))
+
+  def save(self, path, overwrite=False):
+    """
+    Add the terms and documents appended since the last ``save`` or ``load`` to the directory ``path``.
+
+    Raises ``FileExistsError`` if ``path`` holds the state of another
+    instance; with ``overwrite`` that state is deleted first.
+    """
+    os.makedirs(path, exist_ok=True)
+    state_path = os.path.join(path, _STATE_FILE)
+    if self._store != os.path.realpath(path):
+      if self.exists(path):
+        if not overwrite:
+          raise FileExistsError("{} already holds an IncrementalTfidf; load it, or save with overwrite=True"
+                                .format(path))
+        for pattern in (_STATE_FILE, "terms-*.txt", "counts-*.npz", "document_frequency-*.npy"):
+          for name in glob.glob(os.path.join(glob.escape(path), pattern)):
+            os.remove(name)
+      # Nothing of this body is in the directory yet.
+      self._saved_documents = self._saved_terms = 0
+    state = {"terms": [], "blocks": []}
+    if os.path.exists(state_path):
+      with open(state_path) as handle:
+        state = json.load(handle)
+
+    # Files are named after their position, so the files of an interrupted
+    # save are overwritten by the next one.
+    if self.n_features > self._saved_terms:
+      name = "terms-{:06d}.txt".format(len(state["terms"]))
+      with open(os.path.join(path, name), "w", encoding="utf-8") as handle:
+        for term in list(self.vocabulary_)[self._saved_terms:]:
+          handle.write(term + "\n")
+      state["terms"].append(name)
+    previous_frequency = state.get("document_frequency")
+    if self.n_documents_ > self._saved_documents:
+      name = "counts-{:06d}.npz".format(len(state["blocks"]))
+      sp.save_npz(os.path.join(path, name), self._rows_since(self._saved_documents))
+      state["blocks"].append(name)
+      # Named after the new block, so it never overwrites the file the
+      # current state points to.
+      name = "document_frequency-{:06d}.npy".format(len(state["blocks"]) - 1)
+      np.save(os.path.join(path, name), self.document_frequency_)
+      state["document_frequency"] = name
+
+    # The state file is replaced last, so an interrupted save leaves the
+    # previous state readable.
+    state.update(n_documents=self.n_documents_, n_features=self.n_features, norm=self.norm,
+                 smooth_idf=self.smooth_idf, sublinear_tf=self.sublinear_tf, count_params=_json_params(self.count_params))
+    with open(state_path + ".tmp", "w") as handle:
+      json.dump(state, handle, indent=2)
+    os.replace(state_path + ".tmp", state_path)
+    if previous_frequency is not None and previous_frequency != state["document_frequency"]:
+      os.remove(os.path.join(path, previous_frequency))
+    self._store = os.path.realpath(path)
+    self._saved_documents = self.n_documents_
+    self._saved_terms = self.n_features
+
+  @classmethod
+  def load(cls, path):
+    """Restore the state written to ``path`` by ``save``; the rows are read when first needed."""
+    with open(os.path.join(path, _STATE_FILE)) as handle:
+      state = json.load(handle)
+    count_params = state["count_params"]
+    if "ngram_range" in count_params:
+      count_params["ngram_range"] = tuple(count_params["ngram_range"])
+    if "dtype" in count_params:
+      count_params["dtype"] = np.dtype(count_params["dtype"]).type
+    incremental = cls(norm=state["norm"], smooth_idf=state["smooth_idf"], sublinear_tf=state["sublinear_tf"],
+                      **count_params)
+
+    terms = []
+    for name in state["terms"]:
+      with open(os.path.join(path, name), encoding="utf-8") as handle:
+        terms.extend(line.rstrip("\n") for line in handle)
+    incremental.vocabulary_ = {term: index for index, term in enumerate(terms)}
+    incremental._block_files = [os.path.join(path, name) for name in state["blocks"]]
+    incremental.n_documents_ = incremental._file_rows = state["n_documents"]
+    if "document_frequency" in state:
+      incremental.document_frequency_ = np.load(os.path.join(path, state["document_frequency"]))
+    else:
+      # Written before the document frequencies were saved: count them.
+      incremental.document_frequency_ = np.bincount(
+        np.concatenate([block.indices for block in incremental._read_blocks()] + [np.zeros(0, dtype=np.int64)]),
+        minlength=len(terms)).astype(np.int64)
+    incremental._store = os.path.realpath(path)
+    incremental._saved_documents = incremental.n_documents_
+    incremental._saved_terms = len(terms)
+    return incremental
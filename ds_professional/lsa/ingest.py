@@ -0,0 +1,118 @@
+"""
+Columnar ingestion of the body.
+
+``body.csv`` is converted once into Parquet, with an explicit schema,
+compression and one directory per ``title``. Later loads read only the
+projected columns (``sentence`` and ``title`` by default) instead of
+re-parsing every column of the CSV as text.
+
+The Spark functions take a SparkSession; the single-node functions use
+PyArrow directly and hand the table to pandas without a copy when
+``arrow_dtypes=True``. A partitioned data set is stored grouped by
+partition, so both conversions also write the position of every line of the
+CSV as ``line``. ``read_body_pandas`` sorts by it on the driver and returns
+the body in the line order of the CSV, like ``pandas.read_csv``;
+``load_body`` leaves the Spark DataFrame in scan order rather than sort the
+whole body across the cluster on every load.
+
+Both conversions assume one record per line of the CSV, so that the file can
+be split and parsed in parallel. Pass ``multi_line=True`` only when quoted
+fields contain newlines: the parser then has to read the file from the start,
+and Spark converts it in a single task.
+"""
+
+BODY_COLUMNS = ("sentence", "title")
+PARTITION_COLS = ("title",)
+LINE_COL = "line"
+
+
+def convert_to_parquet(spark, csv_path, parquet_path, columns=BODY_COLUMNS, partition_cols=PARTITION_COLS,
+                       compression="zstd", mode="overwrite", multi_line=False):
+  """
+  Convert ``csv_path`` into a Parquet data set at ``parquet_path`` with Spark.
+
+  Set ``multi_line`` only if quoted fields of the CSV contain newlines.
+  """
+  from pyspark.sql.functions import col, monotonically_increasing_id
+
+  # The ids increase with the position in the file, which is all the
+  # readers need to restore the line order.
+  bodyDF = (spark.read
+    .option("header", "true")
+    .option("multiLine", "true" if multi_line else "false")
+    .option("escape", '"')
+    .csv(csv_path)
+    .select(*[col(c).cast("string") for c in columns])
+    .withColumn(LINE_COL, monotonically_increasing_id()))
+  (bodyDF.write
+    .mode(mode)
+    .option("compression", compression)
+    .partitionBy(*partition_cols)
+    .parquet(parquet_path))
+
+
+def load_body(spark, parquet_path, columns=BODY_COLUMNS):
+  """
+  Read only ``columns`` of the Parquet body; the projection is pushed down to the scan.
+
+  Rows come in scan order, grouped by partition. Include ``line`` in
+  ``columns`` where the order of the CSV matters, or read the body on the
+  driver with ``read_body_pandas``.
+  """
+  return spark.read.parquet(parquet_path).select(*columns)
+
+
+def convert_csv_to_parquet(csv_path, parquet_path, columns=BODY_COLUMNS, partition_cols=PARTITION_COLS,
+                           compression="zstd", block_size=1 << 24, multi_line=False):
+  """
+  Convert ``csv_path`` into a Parquet data set on a single node with PyArrow.
+
+  The CSV is streamed in blocks of ``block_size`` bytes and only ``columns``
+  are parsed, all of them as strings; the line number of every row is
+  added as ``line``. Set ``multi_line`` only if quoted fields of the CSV
+  contain newlines.
+  """
+  import pyarrow as pa
+  import pyarrow.csv as pv
+  import pyarrow.dataset as ds
+
+  reader = pv.open_csv(
+    csv_path,
+    read_options=pv.ReadOptions(block_size=block_size),
+    parse_options=pv.ParseOptions(newlines_in_values=multi_line),
+    convert_options=pv.ConvertOptions(include_columns=list(columns),
+                                      column_types={c: pa.string() for c in columns}))
+  schema = reader.schema.append(pa.field(LINE_COL, pa.int64()))
+
+  def numbered(batches):
+    start = 0
+    for batch in batches:
+      lines = pa.array(range(start, start + batch.num_rows), type=pa.int64())
+      start += batch.num_rows
+      yield pa.RecordBatch.from_arrays(batch.columns + [lines], schema=schema)
+
+  ds.write_dataset(numbered(reader), parquet_path, schema=schema, format="parquet",
+                   partitioning=list(partition_cols),
+                   partitioning_flavor="hive", existing_data_behavior="delete_matching",
+                   file_options=ds.ParquetFileFormat().make_write_options(compression=compression))
+
+
+def read_body_pandas(parquet_path, columns=BODY_COLUMNS, arrow_dtypes=True):
+  """
+  Read ``columns`` of the Parquet body into pandas on a single node.
+
+  Rows are in the line order of the CSV when the data set has a ``line``
+  column. With ``arrow_dtypes`` the columns are backed by the Arrow buffers
+  themselves (``pd.ArrowDtype``) rather than converted to Python objects.
+  """
+  import pandas as pd
+  import pyarrow.dataset as ds
+
+  dataset = ds.dataset(parquet_path, format="parquet", partitioning="hive")
+  if LINE_COL in dataset.schema.names:
+    table = dataset.to_table(columns=list(columns) + [LINE_COL]).sort_by(LINE_COL).drop_columns([LINE_COL])
+  else:
+    table = dataset.to_table(columns=list(columns))
+  if arrow_dtypes:
+    return table.to_pandas(types_mapper=pd.ArrowDtype)
+  return table.to_pandas(split_blocks=True, self_destruct=True)
@@ -0,0 +1,78 @@
+"""
+The notebook's single-node LSA as one function.
+
+``run_lsa`` vectorizes the body, fits the SVD and assembles
+``topic_encoded_df`` and ``encoding_matrix`` the same way the notebook's
+cells do. With ``dtype=np.float32`` every stage stays in single precision
+with int32 sparse indices, which halves the memory of the matrices, and the
+``memory`` table of the result shows the size and dtype of every stage.
+"""
+
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from sklearn.feature_extraction.text import CountVectorizer
+
+from lsa.svd import IncrementalTruncatedSVD
+from lsa.topics import topic_columns
+from lsa.vectorize import compact_indices, fused_count_tfidf
+
+LSAResult = namedtuple("LSAResult", ["vectorizer", "svd", "bag_of_words", "lsa", "topic_encoded_df",
+                                     "encoding_matrix", "memory"])
+
+
+def nbytes(obj):
+  """Bytes held by the arrays of a NumPy array, sparse matrix or DataFrame."""
+  if sp.issparse(obj):
+    obj = sp.csr_matrix(obj)
+    return obj.data.nbytes + obj.indices.nbytes + obj.indptr.nbytes
+  if isinstance(obj, pd.DataFrame):
+    return int(obj.memory_usage(index=True, deep=False).sum())
+  return np.asarray(obj).nbytes
+
+
+def _stage(name, obj):
+  dtype = obj.dtypes.iloc[0] if isinstance(obj, pd.DataFrame) else obj.dtype
+  indices = obj.indices.dtype if sp.issparse(obj) else None
+  return {"stage": name, "shape": obj.shape, "dtype": str(dtype),
+          "index_dtype": None if indices is None else str(indices), "bytes": nbytes(obj)}
+
+
+def run_lsa(documents, n_components=2, weighting="count", dtype=np.float64, n_iter=5, random_state=None,
+            **count_params):
+  """
+  Vectorize ``documents``, fit the SVD and build the notebook's DataFrames.
+
+  ``weighting`` is ``"count"`` or ``"tfidf"``; ``count_params`` go to
+  ``CountVectorizer``. ``topic_encoded_df`` holds ``topic_1 .. topic_k`` and
+  the ``sentence`` of every document; ``encoding_matrix`` holds the topic
+  loadings and the ``terms`` of the dictionary.
+  """
+  if weighting not in ("count", "tfidf"):
+    raise ValueError("weighting must be 'count' or 'tfidf', got {!r}".format(weighting))
+  if weighting == "tfidf":
+    document_terms = fused_count_tfidf(documents, dtype=dtype, **count_params)
+    vectorizer, bag_of_words = document_terms.vectorizer, document_terms.tfidf
+  else:
+    vectorizer = CountVectorizer(dtype=dtype, **count_params)
+    bag_of_words = compact_indices(vectorizer.fit_transform(documents))
+
+  svd = IncrementalTruncatedSVD(n_components=n_components, n_iter=n_iter, random_state=random_state)
+  lsa = svd.fit_transform(bag_of_words)
+
+  columns = topic_columns(n_components)
+  # pd.DataFrame keeps the dtype of the arrays, so float32 stays float32.
+  topic_encoded_df = pd.DataFrame(lsa, columns=columns)
+  topic_encoded_df["sentence"] = np.asarray(documents, dtype=object)
+  encoding_matrix = pd.DataFrame(svd.components_.T, columns=columns)
+  encoding_matrix["terms"] = vectorizer.get_feature_names_out()
+
+  memory = pd.DataFrame([
+    _stage("bag_of_words", bag_of_words),
+    _stage("svd.components_", svd.components_),
+    _stage("lsa", lsa),
+    _stage("topic_encoded_df", topic_encoded_df[columns]),
+    _stage("encoding_matrix", encoding_matrix[columns])])
+  return LSAResult(vectorizer, svd, bag_of_words, lsa, topic_encoded_df, encoding_matrix, memory)
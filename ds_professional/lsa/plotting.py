@@ -0,0 +1,131 @@
+"""
+Topic plots that stay fast and readable at millions of documents.
+
+Instead of one ``ax.scatter`` per class over every document, ``density_scatter``
+bins the plane of two topics into a raster with a single ``np.bincount`` over
+class x bin, draws it as one image whose color mixes the classes of each bin
+and whose opacity grows with the log of its density, and overlays a
+stratified sample of at most ``sample`` points per class. Drawing cost only
+depends on ``bins`` and ``sample``, not on the number of documents.
+"""
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_COLORS = ("green", "red", "tab:blue", "tab:orange", "tab:purple", "tab:brown")
+
+
+def _extent(x, y, padding=0.02):
+  finite = np.isfinite(x) & np.isfinite(y)
+  x_min, x_max = (x[finite].min(), x[finite].max()) if finite.any() else (0.0, 1.0)
+  y_min, y_max = (y[finite].min(), y[finite].max()) if finite.any() else (0.0, 1.0)
+  x_pad = (x_max - x_min) * padding or 0.5
+  y_pad = (y_max - y_min) * padding or 0.5
+  return float(x_min - x_pad), float(x_max + x_pad), float(y_min - y_pad), float(y_max + y_pad)
+
+
+def class_histograms(x, y, classes, bins=256, extent=None):
+  """
+  2-D histograms of ``(x, y)`` for every class in one pass.
+
+  Returns ``(counts, class_values, extent)`` where ``counts[c, i, j]`` is the
+  number of points of ``class_values[c]`` in row ``i`` (``y``) and column
+  ``j`` (``x``) of a ``bins`` x ``bins`` grid over ``extent`` =
+  ``(x_min, x_max, y_min, y_max)``. Points outside ``extent``, not finite
+  or without a class (None or NaN) are dropped.
+  """
+  x = np.asarray(x, dtype=np.float64)
+  y = np.asarray(y, dtype=np.float64)
+  codes, class_values = pd.factorize(np.asarray(classes), sort=True)
+  if extent is None:
+    extent = _extent(x, y)
+  x_min, x_max, y_min, y_max = extent
+
+  column = np.floor((x - x_min) / (x_max - x_min) * bins)
+  row = np.floor((y - y_min) / (y_max - y_min) * bins)
+  # x_max and y_max themselves belong to the last bin.
+  column[x == x_max] = bins - 1
+  row[y == y_max] = bins - 1
+  # factorize codes missing classes as -1.
+  inside = (codes >= 0) & (column >= 0) & (column < bins) & (row >= 0) & (row < bins)
+
+  flat = (codes[inside] * bins + row[inside].astype(np.int64)) * bins + column[inside].astype(np.int64)
+  counts = np.bincount(flat, minlength=len(class_values) * bins * bins)
+  return counts.reshape(len(class_values), bins, bins), class_values, extent
+
+
+def stratified_sample(classes, n_per_class, random_state=None):
+  """Sorted row positions of at most ``n_per_class`` random rows of every class; rows without a class are skipped."""
+  rng = np.random.default_rng(random_state)
+  codes, _ = pd.factorize(np.asarray(classes), sort=True)
+  class_sizes = np.bincount(codes[codes >= 0])
+  # Keep every row with about twice the probability needed, so that the
+  # sort that picks exactly n_per_class rows only sees the candidates.
+  keep = np.append(np.minimum(1.0, 2.0 * n_per_class / np.maximum(class_sizes, 1)), 0.0)
+  # Missing classes (code -1) pick the trailing 0.0 and are never kept.
+  candidates = np.flatnonzero(rng.random(len(codes)) < keep[codes])
+  candidate_codes = codes[candidates]
+  order = np.lexsort((rng.random(len(candidates)), candidate_codes))
+  sorted_codes = candidate_codes[order]
+  rank = np.arange(len(order)) - np.searchsorted(sorted_codes, sorted_codes, side="left")
+  return np.sort(candidates[order[rank < n_per_class]])
+
+
+def density_image(counts, colors):
+  """
+  RGBA raster of per-class ``counts``.
+
+  Each bin takes the count-weighted mix of the class ``colors`` and an
+  opacity of ``log1p(count) / log1p(max count)``.
+  """
+  from matplotlib.colors import to_rgb
+
+  palette = np.asarray([to_rgb(color) for color in colors])
+  total = counts.sum(axis=0).astype(np.float64)
+  image = np.zeros(total.shape + (4,))
+  occupied = total > 0
+  image[..., :3] = np.einsum("cij,ck->ijk", counts, palette) / np.where(occupied, total, 1)[..., None]
+  if occupied.any():
+    image[..., 3] = np.log1p(total) / np.log1p(total.max())
+  return image
+
+
+def density_scatter(ax, x, y, classes, labels=None, colors=None, bins=256, sample=2000, alpha=0.5,
+                    markers=None, extent=None, random_state=0):
+  """
+  Draw ``(x, y)`` by class on ``ax`` as a density raster plus a sample of points.
+
+  ``labels``, ``colors`` and ``markers`` map a class value to its legend
+  label, color and marker. ``sample`` points per class are drawn on top of
+  the raster; pass ``sample=0`` for the raster alone or ``bins=0`` for the
+  sampled scatter alone. Points without a class (None or NaN) are not drawn.
+  Returns the ``(counts, class_values, extent)`` of ``class_histograms``, or
+  None without a raster.
+  """
+  x = np.asarray(x)
+  y = np.asarray(y)
+  classes = np.asarray(classes)
+  class_values = np.asarray(pd.factorize(classes, sort=True)[1])
+  labels = labels or {}
+  markers = markers or {}
+  if colors is None:
+    colors = dict(zip(class_values, DEFAULT_COLORS))
+
+  histograms = None
+  if bins:
+    histograms = class_histograms(x, y, classes, bins=bins, extent=extent)
+    counts, class_values, extent = histograms
+    ax.imshow(density_image(counts, [colors[value] for value in class_values]), origin="lower",
+              extent=extent, aspect="auto", interpolation="nearest")
+
+  if sample:
+    rows = stratified_sample(classes, sample, random_state=random_state)
+    sampled = classes[rows]
+    for value in class_values:
+      mask = sampled == value
+      ax.scatter(x[rows][mask], y[rows][mask], c=colors[value], marker=markers.get(value, "o"), alpha=alpha,
+                 s=8, label=labels.get(value, str(value)))
+  else:
+    for value in class_values:
+      ax.scatter([], [], c=colors[value], marker=markers.get(value, "o"), label=labels.get(value, str(value)))
+  return histograms
@@ -0,0 +1,165 @@
+"""
+Stage-level instrumentation of the LSA pipeline.
+
+Wrap each stage of the pipeline in ``profiler.stage(name)`` to record its
+wall and CPU time and the process' peak RSS, and attach the shape, nnz and
+size of the matrices it produced with ``record.matrix``. The overhead is a
+couple of system calls per stage, cheap enough to leave on; allocation
+tracking with ``tracemalloc`` is much more expensive and off by default.
+
+The results are available as a JSON report, a pandas summary table and
+Chrome trace events (open them in ``chrome://tracing`` or Perfetto).
+"""
+
+import json
+import os
+import resource
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+import numpy as np
+
+try:
+  _PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+except (AttributeError, ValueError, OSError):
+  _PAGE_SIZE = None
+
+
+def current_rss():
+  """Resident set size of this process in bytes, or None where unavailable."""
+  if _PAGE_SIZE is None:
+    return None
+  try:
+    with open("/proc/self/statm") as handle:
+      return int(handle.read().split()[1]) * _PAGE_SIZE
+  except OSError:
+    return None
+
+
+def peak_rss():
+  """High-water mark of the resident set size of this process in bytes."""
+  peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  # Linux reports kilobytes, macOS bytes.
+  return peak if os.uname().sysname == "Darwin" else peak * 1024
+
+
+def matrix_stats(X):
+  """Shape, dtype, nnz and bytes of a dense or sparse matrix, or a DataFrame."""
+  stats = {"shape": list(getattr(X, "shape", ())), "type": type(X).__name__}
+  if hasattr(X, "nnz"):
+    stats.update(dtype=str(X.dtype), nnz=int(X.nnz),
+                 bytes=int(sum(getattr(X, name).nbytes for name in ("data", "indices", "indptr")
+                               if hasattr(X, name))))
+  elif hasattr(X, "memory_usage"):
+    stats.update(bytes=int(X.memory_usage(index=True, deep=False).sum()))
+  elif hasattr(X, "nbytes"):
+    stats.update(dtype=str(X.dtype), nnz=int(np.count_nonzero(X)), bytes=int(X.nbytes))
+  return stats
+
+
+class StageRecord(dict):
+  """The measurements of one stage; a plain dict once the stage has ended."""
+
+  def matrix(self, name, X):
+    """Attach the statistics of the matrix ``X`` produced by this stage."""
+    self.setdefault("matrices", {})[name] = matrix_stats(X)
+    return X
+
+
+class PipelineProfiler:
+  """
+  Collects ``StageRecord``s for the stages run under ``stage``.
+
+  Stages may be nested; ``track_allocations`` adds the peak of Python
+  allocations within each stage as measured by ``tracemalloc``.
+  """
+
+  def __init__(self, name="lsa", track_allocations=False):
+    self.name = name
+    self.track_allocations = track_allocations
+    self.records = []
+    self._origin = time.perf_counter()
+    self._depth = threading.local()
+
+  @contextmanager
+  def stage(self, name, **attributes):
+    depth = getattr(self._depth, "value", 0)
+    record = StageRecord(stage=name, depth=depth, **attributes)
+    self.records.append(record)
+
+    tracing = self.track_allocations and depth == 0
+    if tracing:
+      tracemalloc.start()
+    rss_before = current_rss()
+    peak_before = peak_rss()
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    self._depth.value = depth + 1
+    try:
+      yield record
+    finally:
+      self._depth.value = depth
+      wall_end = time.perf_counter()
+      record["start_s"] = wall_start - self._origin
+      record["wall_s"] = wall_end - wall_start
+      record["cpu_s"] = time.process_time() - cpu_start
+      rss_after = current_rss()
+      record["rss_mb"] = None if rss_after is None else rss_after / 2 ** 20
+      record["rss_delta_mb"] = None if rss_after is None or rss_before is None else (rss_after - rss_before) / 2 ** 20
+      peak_after = peak_rss()
+      record["peak_rss_mb"] = peak_after / 2 ** 20
+      record["peak_rss_growth_mb"] = (peak_after - peak_before) / 2 ** 20
+      if tracing:
+        record["alloc_peak_mb"] = tracemalloc.get_traced_memory()[1] / 2 ** 20
+        tracemalloc.stop()
+
+  def wrap(self, name, fn):
+    """``fn`` with every call profiled as the stage ``name``."""
+    def wrapped(*args, **kwargs):
+      with self.stage(name):
+        return fn(*args, **kwargs)
+    wrapped.__name__ = getattr(fn, "__name__", name)
+    wrapped.__doc__ = getattr(fn, "__doc__", None)
+    return wrapped
+
+  def report(self):
+    return {"pipeline": self.name, "stages": [dict(record) for record in self.records]}
+
+  def to_json(self, path=None):
+    """The report as a JSON string, also written to ``path`` when given."""
+    text = json.dumps(self.report(), indent=2, default=str)
+    if path is not None:
+      with open(path, "w") as handle:
+        handle.write(text)
+    return text
+
+  def summary(self):
+    """One row per stage, with the statistics of its first recorded matrix."""
+    import pandas as pd
+
+    rows = []
+    for record in self.records:
+      row = {key: value for key, value in record.items() if key != "matrices"}
+      row["stage"] = "  " * record["depth"] + record["stage"]
+      for matrix_name, stats in list(record.get("matrices", {}).items())[:1]:
+        row.update(matrix=matrix_name, shape=tuple(stats["shape"]), nnz=stats.get("nnz"),
+                   matrix_mb=stats.get("bytes", 0) / 2 ** 20)
+      rows.append(row)
+    columns = ["stage", "wall_s", "cpu_s", "rss_mb", "rss_delta_mb", "peak_rss_mb", "peak_rss_growth_mb",
+               "alloc_peak_mb", "matrix", "shape", "nnz", "matrix_mb"]
+    frame = pd.DataFrame(rows)
+    return frame[[column for column in columns if column in frame.columns]]
+
+  def trace_events(self):
+    """The stages as Chrome trace "complete" events."""
+    return [{"name": record["stage"], "ph": "X", "pid": os.getpid(), "tid": record["depth"],
+             "ts": record["start_s"] * 1e6, "dur": record["wall_s"] * 1e6,
+             "args": {key: value for key, value in record.items()
+                      if key not in ("stage", "start_s", "wall_s", "depth")}}
+            for record in self.records if "wall_s" in record]
+
+  def save_trace(self, path):
+    with open(path, "w") as handle:
+      json.dump({"traceEvents": self.trace_events()}, handle, default=str)
@@ -0,0 +1,158 @@
+"""
+Semantic search over topic-encoded documents.
+
+New text is projected through the fitted vectorizer and SVD, and the top-k
+documents by cosine similarity are found with an inverted-file (IVF) index:
+the unit-normalized document vectors are clustered by spherical k-means and
+a query only scans the ``n_probe`` clusters whose centroids are closest to it.
+"""
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+
+def _normalize_rows(vectors):
+  vectors = np.asarray(vectors, dtype=np.float32)
+  norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+  norms[norms == 0] = 1
+  return vectors / norms
+
+
+def _assign(vectors, centroids, chunk_size=65536):
+  # Nearest centroid by cosine, in chunks so the n x n_lists score matrix is
+  # never held in full.
+  assignment = np.empty(vectors.shape[0], dtype=np.int64)
+  for start in range(0, vectors.shape[0], chunk_size):
+    chunk = vectors[start:start + chunk_size]
+    assignment[start:start + chunk_size] = np.argmax(chunk @ centroids.T, axis=1)
+  return assignment
+
+
+def spherical_kmeans(vectors, n_clusters, n_iter=20, random_state=None):
+  """Centroids of unit-normalized ``vectors`` clustered by cosine similarity."""
+  rng = np.random.default_rng(random_state)
+  centroids = vectors[rng.choice(vectors.shape[0], n_clusters, replace=False)].copy()
+  for _ in range(n_iter):
+    assignment = _assign(vectors, centroids)
+    membership = sp.csr_matrix((np.ones(len(assignment), dtype=np.float32),
+                                (assignment, np.arange(len(assignment)))),
+                               shape=(n_clusters, vectors.shape[0]))
+    sums = np.asarray(membership @ vectors)
+    empty = np.asarray(membership.sum(axis=1)).ravel() == 0
+    sums[empty] = vectors[rng.choice(vectors.shape[0], int(empty.sum()))]
+    updated = _normalize_rows(sums)
+    if np.allclose(updated, centroids):
+      break
+    centroids = updated
+  return centroids
+
+
+class IVFIndex:
+  """
+  Inverted-file index for top-k cosine queries.
+
+  ``n_lists`` defaults to about ``sqrt(n)`` clusters. Vectors are stored
+  sorted by cluster so that each probed cluster is one contiguous block.
+  """
+
+  def __init__(self, n_lists=None, n_probe=8, n_iter=20, max_train_size=None, random_state=None):
+    self.n_lists = n_lists
+    self.n_probe = n_probe
+    self.n_iter = n_iter
+    self.max_train_size = max_train_size
+    self.random_state = random_state
+
+  def fit(self, vectors):
+    vectors = _normalize_rows(vectors)
+    n_lists = self.n_lists or max(1, int(np.sqrt(vectors.shape[0])))
+    n_lists = min(n_lists, vectors.shape[0])
+    max_train_size = self.max_train_size or 256 * n_lists
+    train = vectors
+    if vectors.shape[0] > max_train_size:
+      rng = np.random.default_rng(self.random_state)
+      train = vectors[rng.choice(vectors.shape[0], max_train_size, replace=False)]
+    self.centroids_ = spherical_kmeans(train, n_lists, n_iter=self.n_iter, random_state=self.random_state)
+
+    assignment = _assign(vectors, self.centroids_)
+    order = np.argsort(assignment, kind="stable")
+    self.ids_ = order
+    self.vectors_ = vectors[order]
+    self.list_offsets_ = np.concatenate([[0], np.cumsum(np.bincount(assignment, minlength=n_lists))])
+    return self
+
+  def search(self, queries, k=10, n_probe=None):
+    """
+    Top-``k`` cosine scores and document ids for every row of ``queries``.
+
+    Both results are ``len(queries) x k`` arrays; when fewer than ``k``
+    documents are found the ids are padded with -1 and the scores with -inf.
+    """
+    queries = _normalize_rows(np.atleast_2d(queries))
+    n_probe = min(n_probe or self.n_probe, self.centroids_.shape[0])
+    scores = np.full((queries.shape[0], k), -np.inf, dtype=np.float32)
+    ids = np.full((queries.shape[0], k), -1, dtype=np.int64)
+
+    centroid_scores = queries @ self.centroids_.T
+    probes = np.argpartition(-centroid_scores, n_probe - 1, axis=1)[:, :n_probe]
+    for q, query in enumerate(queries):
+      candidates = np.concatenate([np.arange(self.list_offsets_[c], self.list_offsets_[c + 1])
+                                   for c in probes[q]])
+      if not len(candidates):
+        continue
+      candidate_scores = self.vectors_[candidates] @ query
+      top = min(k, len(candidates))
+      best = np.argpartition(-candidate_scores, top - 1)[:top]
+      best = best[np.argsort(-candidate_scores[best], kind="stable")]
+      scores[q, :top] = candidate_scores[best]
+      ids[q, :top] = self.ids_[candidates[best]]
+    return scores, ids
+
+
+def brute_force_search(vectors, queries, k=10):
+  """Exact top-``k`` cosine search, the reference for the index's recall."""
+  vectors = _normalize_rows(vectors)
+  queries = _normalize_rows(np.atleast_2d(queries))
+  similarity = queries @ vectors.T
+  k = min(k, vectors.shape[0])
+  ids = np.argpartition(-similarity, k - 1, axis=1)[:, :k]
+  order = np.argsort(-np.take_along_axis(similarity, ids, axis=1), axis=1, kind="stable")
+  ids = np.take_along_axis(ids, order, axis=1)
+  return np.take_along_axis(similarity, ids, axis=1), ids
+
+
+class SemanticSearch:
+  """
+  "Find lines similar to this query" over a fitted LSA.
+
+  ``vectorizer`` and ``svd`` are the fitted models of the notebook and
+  ``lsa`` the topic encodings of the body whose text is ``texts``.
+  """
+
+  def __init__(self, vectorizer, svd, lsa, texts=None, **index_params):
+    self.vectorizer = vectorizer
+    self.svd = svd
+    # Converted once: indexing a Series or list per query would copy the
+    # whole text column every time.
+    self.texts = None if texts is None else np.asarray(texts, dtype=object)
+    self.index = IVFIndex(**index_params).fit(lsa)
+
+  def encode(self, queries):
+    return self.svd.transform(self.vectorizer.transform(list(queries)))
+
+  def search(self, queries, k=10, n_probe=None):
+    """A DataFrame with the ``k`` best matches of every query in ``queries``."""
+    if isinstance(queries, str):
+      queries = [queries]
+    queries = list(queries)
+    scores, ids = self.index.search(self.encode(queries), k=k, n_probe=n_probe)
+    found = ids >= 0
+    query_positions, ranks = np.nonzero(found)
+    results = pd.DataFrame({
+      "query": np.asarray(queries, dtype=object)[query_positions],
+      "rank": ranks + 1,
+      "id": ids[found],
+      "score": scores[found]})
+    if self.texts is not None:
+      results["sentence"] = self.texts[results["id"].values]
+    return results
@@ -0,0 +1,86 @@
+"""
+Choosing the number of topics.
+
+Every candidate k is evaluated from a single SVD fitted at the largest
+candidate rank: the top k topics of a rank-K truncated SVD are the rank-k
+truncated SVD, so explained variance, reconstruction error and topic
+coherence of every k < K are read off that one factorization.
+"""
+
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from joblib import Parallel, delayed
+
+from lsa.svd import IncrementalTruncatedSVD
+from lsa.topics import top_term_indices
+
+TopicCountSelection = namedtuple("TopicCountSelection", ["n_components", "curve", "svd"])
+
+
+def umass_coherence(occurrences, terms):
+  """
+  UMass coherence of the topic whose top terms are the columns ``terms``.
+
+  ``occurrences`` is the binary CSC document-term matrix. Terms are in rank
+  order; the score is the mean over ranked pairs of
+  ``log((D(w_i, w_j) + 1) / D(w_j))``, higher meaning more coherent.
+  """
+  block = occurrences[:, terms]
+  co_occurrence = np.asarray((block.T @ block).todense(), dtype=np.float64)
+  document_frequency = np.diag(co_occurrence)
+  i, j = np.tril_indices(len(terms), k=-1)
+  valid = document_frequency[j] > 0
+  if not valid.any():
+    return np.nan
+  return float(np.mean(np.log((co_occurrence[i, j][valid] + 1) / document_frequency[j][valid])))
+
+
+def _knee(ks, values):
+  # The candidate furthest above the straight line joining the two ends of
+  # the normalized curve, i.e. where adding topics stops paying off.
+  ks = np.asarray(ks, dtype=np.float64)
+  values = np.asarray(values, dtype=np.float64)
+  if len(ks) < 3 or values[-1] == values[0]:
+    return int(ks[-1])
+  x = (ks - ks[0]) / (ks[-1] - ks[0])
+  y = (values - values[0]) / (values[-1] - values[0])
+  return int(ks[np.argmax(y - x)])
+
+
+def select_n_components(X, candidates=(2, 5, 10, 20, 50, 100), n_top_terms=10, n_jobs=None, n_iter=5,
+                        random_state=None):
+  """
+  Evaluate every candidate number of topics from one SVD of ``X``.
+
+  Returns a ``TopicCountSelection`` with the recommended ``n_components``,
+  the ``curve`` (one row per candidate with ``explained_variance_ratio``,
+  ``reconstruction_error`` relative to ``||X||`` and mean ``coherence`` of the
+  top ``n_top_terms`` terms per topic) and the ``svd`` fitted at the largest
+  rank. Topic coherences are computed in parallel over ``n_jobs`` threads.
+  """
+  candidates = sorted(set(int(k) for k in candidates if 0 < k < min(X.shape)))
+  if not candidates:
+    raise ValueError("no candidate is smaller than min(X.shape) = {}".format(min(X.shape)))
+  svd = IncrementalTruncatedSVD(n_components=candidates[-1], n_iter=n_iter, random_state=random_state).fit(X)
+
+  X = sp.csc_matrix(X)
+  total_energy = float(np.dot(X.data, X.data))
+  captured_energy = np.cumsum(np.square(svd.singular_values_.astype(np.float64)))
+  explained = np.cumsum(svd.explained_variance_ratio_)
+
+  occurrences = X.astype(bool).astype(np.int32)
+  top = top_term_indices(svd.components_, n_terms=n_top_terms, ranking="absolute")
+  coherence = np.asarray(Parallel(n_jobs=n_jobs, prefer="threads")(
+    delayed(umass_coherence)(occurrences, terms) for terms in top))
+  mean_coherence = np.cumsum(np.nan_to_num(coherence)) / np.arange(1, len(coherence) + 1)
+
+  rows = np.asarray(candidates) - 1
+  curve = pd.DataFrame({
+    "n_components": candidates,
+    "explained_variance_ratio": explained[rows],
+    "reconstruction_error": np.sqrt(np.maximum(total_energy - captured_energy[rows], 0) / total_energy),
+    "coherence": mean_coherence[rows]})
+  return TopicCountSelection(_knee(candidates, curve["explained_variance_ratio"]), curve, svd)
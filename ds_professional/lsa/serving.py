@@ -0,0 +1,243 @@
+"""
+Projecting new documents into topic space as they arrive.
+
+``TopicProjectionService`` loads a fitted dictionary and ``components_`` once
+and scores text submitted through an asyncio queue. Pending requests are
+grouped into micro-batches of up to ``max_batch_size`` documents, or whatever
+arrived within ``max_wait_ms``, and vectorized and projected together on a
+worker thread, so the event loop keeps accepting requests in the meantime.
+
+Run ``python -m lsa.serving <model.npz> <texts.txt>`` for a local load test
+with requests drawn from the lines of ``texts.txt``.
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+
+import numpy as np
+from sklearn.feature_extraction.text import CountVectorizer
+
+# Put on the queue by ``stop``: everything submitted before it is still served.
+_STOP = object()
+
+
+def save_model(path, vectorizer, components, idf=None):
+  """Write what the service needs from a fitted ``vectorizer`` and ``svd.components_``."""
+  terms = vectorizer.get_feature_names_out()
+  params = {name: value for name, value in vectorizer.get_params().items()
+            if name in ("lowercase", "token_pattern", "ngram_range", "stop_words", "strip_accents")}
+  if isinstance(params.get("stop_words"), (set, frozenset)):
+    params["stop_words"] = sorted(params["stop_words"])
+  arrays = {"terms": np.asarray(terms, dtype=str), "components": np.asarray(components),
+            "params": np.asarray(json.dumps(params))}
+  if idf is not None:
+    arrays["idf"] = np.asarray(idf)
+  np.savez(path, **arrays)
+
+
+def load_model(path):
+  """Return ``(vectorizer, components, idf)`` saved by ``save_model``."""
+  with np.load(path) as model:
+    params = json.loads(str(model["params"]))
+    if "ngram_range" in params:
+      params["ngram_range"] = tuple(params["ngram_range"])
+    vectorizer = CountVectorizer(vocabulary=model["terms"].tolist(), **params)
+    idf = model["idf"] if "idf" in model.files else None
+    return vectorizer, model["components"], idf
+
+
+class LatencyRecorder:
+  """Request latencies in milliseconds, with percentiles on demand."""
+
+  def __init__(self):
+    self.latencies_ms = []
+    self.batch_sizes = []
+
+  def record(self, started, batch_size=None):
+    self.latencies_ms.append(1000 * (time.perf_counter() - started))
+    if batch_size is not None:
+      self.batch_sizes.append(batch_size)
+
+  def __len__(self):
+    return len(self.latencies_ms)
+
+  def summary(self, start=0):
+    """Percentiles of the requests recorded from the ``start``-th one on."""
+    if len(self.latencies_ms) <= start:
+      return {"requests": 0}
+    latencies = np.asarray(self.latencies_ms[start:])
+    batch_sizes = self.batch_sizes[start:]
+    return {"requests": len(latencies),
+            "p50_ms": float(np.percentile(latencies, 50)),
+            "p99_ms": float(np.percentile(latencies, 99)),
+            "max_ms": float(latencies.max()),
+            "mean_batch_size": float(np.mean(batch_sizes)) if batch_sizes else None}
+
+
+class TopicProjectionService:
+  """
+  Micro-batching scorer of text into topic vectors.
+
+  Use it as an async context manager, then ``await service.score(text)``
+  from any number of tasks. With ``idf`` the counts are TF-IDF weighted and
+  l2-normalized like the notebook's TF-IDF analysis before projection.
+  ``stop`` serves every request submitted before it and then refuses new
+  ones with ``RuntimeError``.
+  """
+
+  def __init__(self, vectorizer, components, idf=None, max_batch_size=256, max_wait_ms=2.0):
+    self.vectorizer = vectorizer
+    self.components = np.ascontiguousarray(components)
+    self.idf = idf
+    self.max_batch_size = max_batch_size
+    self.max_wait_ms = max_wait_ms
+    self.metrics = LatencyRecorder()
+    self._queue = None
+    self._worker = None
+    self._stopping = False
+
+  @classmethod
+  def from_file(cls, path, **params):
+    vectorizer, components, idf = load_model(path)
+    return cls(vectorizer, components, idf=idf, **params)
+
+  def project(self, texts):
+    """Topic vectors of ``texts``, synchronously; this is what every batch runs."""
+    X = self.vectorizer.transform(texts)
+    if self.idf is not None:
+      from lsa.vectorize import tfidf_from_counts
+      X = tfidf_from_counts(X, idf=self.idf)
+    return np.asarray(X @ self.components.T)
+
+  async def start(self):
+    self._queue = asyncio.Queue()
+    self._stopping = False
+    self._worker = asyncio.create_task(self._serve())
+    return self
+
+  async def stop(self):
+    """Serve the requests already queued, then shut the worker down."""
+    if self._worker is None:
+      return
+    self._stopping = True
+    self._queue.put_nowait(_STOP)
+    try:
+      await self._worker
+    finally:
+      self._worker = None
+      # Only left over if the worker died; their callers must not wait forever.
+      while not self._queue.empty():
+        item = self._queue.get_nowait()
+        if item is not _STOP and not item[1].done():
+          item[1].set_exception(RuntimeError("the service stopped before scoring this request"))
+
+  async def __aenter__(self):
+    return await self.start()
+
+  async def __aexit__(self, *exc_info):
+    await self.stop()
+
+  async def score(self, text):
+    """The topic vector of ``text``, computed in the next micro-batch."""
+    if self._worker is None or self._stopping:
+      raise RuntimeError("the service is not running")
+    future = asyncio.get_running_loop().create_future()
+    self._queue.put_nowait((text, future, time.perf_counter()))
+    return await future
+
+  async def _next_batch(self):
+    """The next micro-batch, and whether ``stop`` was reached."""
+    item = await self._queue.get()
+    if item is _STOP:
+      return [], True
+    batch = [item]
+    deadline = time.perf_counter() + self.max_wait_ms / 1000
+    while len(batch) < self.max_batch_size:
+      if self._queue.empty():
+        timeout = deadline - time.perf_counter()
+        if timeout <= 0:
+          break
+        try:
+          item = await asyncio.wait_for(self._queue.get(), timeout)
+        except asyncio.TimeoutError:
+          break
+      else:
+        # Whatever is already waiting joins the batch without waiting more.
+        item = self._queue.get_nowait()
+      if item is _STOP:
+        return batch, True
+      batch.append(item)
+    return batch, False
+
+  async def _serve(self):
+    loop = asyncio.get_running_loop()
+    stopped = False
+    while not stopped:
+      batch, stopped = await self._next_batch()
+      if not batch:
+        continue
+      texts = [text for text, _, _ in batch]
+      try:
+        vectors = await loop.run_in_executor(None, self.project, texts)
+      except Exception as error:
+        for _, future, _ in batch:
+          if not future.done():
+            future.set_exception(error)
+        continue
+      for (_, future, started), vector in zip(batch, vectors):
+        if not future.done():
+          future.set_result(vector)
+        self.metrics.record(started, len(batch))
+      # Let the callers of this batch run before collecting the next one.
+      await asyncio.sleep(0)
+
+
+async def load_test(service, texts, n_requests=10000, concurrency=64, seed=0):
+  """
+  Score ``n_requests`` random ``texts`` from ``concurrency`` concurrent clients.
+
+  Returns the latency summary of these requests only, not of any scored
+  before, plus the achieved requests/sec.
+  """
+  rng = random.Random(seed)
+  remaining = iter(range(n_requests))
+
+  async def client():
+    for _ in remaining:
+      await service.score(rng.choice(texts))
+
+  first = len(service.metrics)
+  started = time.perf_counter()
+  await asyncio.gather(*[client() for _ in range(concurrency)])
+  summary = service.metrics.summary(start=first)
+  summary["requests_per_second"] = n_requests / (time.perf_counter() - started)
+  return summary
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description="Load test the topic projection service locally.")
+  parser.add_argument("model", help="model file written by lsa.serving.save_model")
+  parser.add_argument("texts", help="text file with one document per line to draw requests from")
+  parser.add_argument("--requests", type=int, default=10000)
+  parser.add_argument("--concurrency", type=int, default=64)
+  parser.add_argument("--max-batch-size", type=int, default=256)
+  parser.add_argument("--max-wait-ms", type=float, default=2.0)
+  args = parser.parse_args(argv)
+
+  with open(args.texts, encoding="utf-8") as handle:
+    texts = [line.rstrip("\n") for line in handle if line.strip()]
+
+  async def run():
+    service = TopicProjectionService.from_file(args.model, max_batch_size=args.max_batch_size,
+                                               max_wait_ms=args.max_wait_ms)
+    async with service:
+      return await load_test(service, texts, n_requests=args.requests, concurrency=args.concurrency)
+
+  print(json.dumps(asyncio.run(run()), indent=2))
+
+
+if __name__ == "__main__":
+  main()
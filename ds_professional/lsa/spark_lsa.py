@@ -0,0 +1,180 @@
+"""
+Spark-native Latent Semantic Analysis.
+
+Tokenization, the document-term matrix and the truncated SVD all run on the
+executors. The only model state brought back to the driver is the dictionary
+and the k x V encoding matrix (``components``).
+
+``add_topic_columns`` goes the other way: it broadcasts a model fitted with
+Scikit-Learn on the driver and scores any Spark DataFrame with it.
+"""
+
+import warnings
+from collections import namedtuple
+from typing import Iterator
+
+import numpy as np
+import pandas as pd
+
+from pyspark.ml import Pipeline
+from pyspark.ml.feature import CountVectorizer, RegexTokenizer, StopWordsRemover
+from pyspark.mllib.linalg import Vectors as MLlibVectors
+from pyspark.mllib.linalg.distributed import RowMatrix
+from pyspark.sql import functions as F
+from pyspark.sql.types import DoubleType, StructField, StructType
+
+from lsa.svd import flip_signs
+from lsa.tokenization import TOKEN_PATTERN as _PYTHON_TOKEN_PATTERN
+from lsa.topics import topic_columns
+
+# The tokens of lsa.tokenization, for Java's regex engine, where the flag that
+# makes \w match unicode word characters is (?U).
+TOKEN_PATTERN = _PYTHON_TOKEN_PATTERN.replace("(?u)", "(?U)", 1)
+
+# The columns added by the pipeline of fit_document_term_model.
+PIPELINE_COLUMNS = ("_tokens", "_terms", "_features")
+
+# The largest vocabSize Spark accepts; it never keeps more terms than it finds.
+_UNLIMITED_VOCAB_SIZE = (1 << 31) - 1
+
+SparkLSAResult = namedtuple(
+  "SparkLSAResult",
+  ["topic_encoded_df", "encoding_matrix", "components", "singular_values", "model"])
+
+
+def english_stop_words():
+  """The Scikit-Learn ``stop_words='english'`` list, falling back to Spark's own."""
+  try:
+    from sklearn.feature_extraction.text import ENGLISH_STOP_WORDS
+    return sorted(ENGLISH_STOP_WORDS)
+  except ImportError:
+    return StopWordsRemover.loadDefaultStopWords("english")
+
+
+def fit_document_term_model(df, text_col="sentence", min_df=1, stop_words="english",
+                            vocab_size=None):
+  """
+  Fit the tokenize -> stop words -> count pipeline on the executors.
+
+  Like Scikit-Learn's ``CountVectorizer`` the dictionary keeps every term by
+  default; with ``vocab_size`` only that many of the most frequent terms are
+  kept, with a warning when terms were cut.
+  """
+  if stop_words == "english":
+    stop_words = english_stop_words()
+
+  stages = [RegexTokenizer(inputCol=text_col, outputCol="_tokens", pattern=TOKEN_PATTERN,
+                           gaps=False, toLowercase=True)]
+  tokens_col = "_tokens"
+  if stop_words:
+    stages.append(StopWordsRemover(inputCol="_tokens", outputCol="_terms", stopWords=list(stop_words)))
+    tokens_col = "_terms"
+  stages.append(CountVectorizer(inputCol=tokens_col, outputCol="_features", minDF=float(min_df),
+                                vocabSize=_UNLIMITED_VOCAB_SIZE if vocab_size is None else vocab_size))
+  model = Pipeline(stages=stages).fit(df)
+  if vocab_size is not None and len(model.stages[-1].vocabulary) >= vocab_size:
+    warnings.warn("the dictionary was cut to the vocab_size={} most frequent terms; the Scikit-Learn "
+                  "pipeline keeps every term".format(vocab_size))
+  return model
+
+
+def spark_lsa(df, n_components=2, text_col="sentence", min_df=1, stop_words="english",
+              vocab_size=None):
+  """
+  Run the LSA of the notebook as a distributed Spark job.
+
+  Returns a ``SparkLSAResult`` where ``topic_encoded_df`` is a Spark DataFrame
+  holding ``topic_1 .. topic_k`` next to the original columns of ``df`` and
+  ``encoding_matrix`` is the pandas terms x topics table.
+  """
+  model = fit_document_term_model(df, text_col=text_col, min_df=min_df, stop_words=stop_words,
+                                  vocab_size=vocab_size)
+  dictionary = model.stages[-1].vocabulary
+
+  featuresDF = model.transform(df).persist()
+  try:
+    rows = featuresDF.select("_features").rdd.map(lambda row: MLlibVectors.fromML(row[0]))
+    # computeU=False: the left singular vectors are never materialized, the
+    # documents are projected onto the components below instead.
+    decomposition = RowMatrix(rows, numCols=len(dictionary)).computeSVD(n_components, computeU=False)
+    components = flip_signs(decomposition.V.toArray().T)
+    singular_values = decomposition.s.toArray()
+
+    # The counts are recomputed from the terms by a pandas UDF: Arrow cannot
+    # carry the ML vectors of _features.
+    topic_encoded_df = project(featuresDF, components, dictionary, tokens_col=model.stages[-1].getInputCol())
+    topic_encoded_df = topic_encoded_df.drop(*[c for c in PIPELINE_COLUMNS if c not in df.columns])
+  finally:
+    featuresDF.unpersist()
+
+  encoding_matrix = pd.DataFrame(components, index=topic_columns(n_components)).T
+  encoding_matrix["terms"] = dictionary
+  return SparkLSAResult(topic_encoded_df, encoding_matrix, components, singular_values, model)
+
+
+def project(df, components, dictionary, tokens_col="_terms"):
+  """
+  Prepend ``topic_1 .. topic_k`` = components . counts to every row of ``df``.
+
+  ``tokens_col`` holds the array of terms of each row and ``dictionary`` the
+  term of every column of ``components``. The terms are counted and projected
+  by an Arrow pandas UDF over whole batches of each partition, with the
+  dictionary and ``components`` broadcast once.
+  """
+  names = topic_columns(components.shape[0])
+  model = df.sparkSession.sparkContext.broadcast(
+    (pd.Index(list(dictionary)), np.ascontiguousarray(components, dtype=np.float64)))
+  schema = StructType([StructField(name, DoubleType()) for name in names])
+
+  @F.pandas_udf(schema)
+  def _project(batches: Iterator[pd.Series]) -> Iterator[pd.DataFrame]:
+    vocabulary, weights = model.value
+    for terms in batches:
+      lengths = terms.map(lambda row: 0 if row is None else len(row)).to_numpy()
+      rows = np.repeat(np.arange(len(terms)), lengths)
+      flat = np.concatenate([row for row in terms if row is not None and len(row)] or [np.empty(0, dtype=object)])
+      columns = vocabulary.get_indexer(flat)
+      known = columns >= 0
+      rows, columns = rows[known], columns[known]
+      # Every occurrence of a term adds its loadings to its row, i.e. counts
+      # times components without building the count matrix.
+      yield pd.DataFrame({name: np.bincount(rows, weights=weights[j, columns], minlength=len(terms))
+                          for j, name in enumerate(names)})
+
+  encodedDF = df.withColumn("_topics", _project(F.col(tokens_col)))
+  return encodedDF.select(*([F.col("_topics")[name].alias(name) for name in names]
+                            + [F.col(c) for c in df.columns]))
+
+
+def add_topic_columns(df, vectorizer, components, text_col="sentence", idf=None):
+  """
+  Append ``topic_1 .. topic_k`` to ``df`` using a model fitted on the driver.
+
+  ``vectorizer`` is the fitted Scikit-Learn vectorizer and ``components`` the
+  ``svd.components_``; pass the ``idf`` of ``fused_count_tfidf`` to score with
+  the TF-IDF weighting. The model is broadcast once and applied by an Arrow
+  pandas UDF to whole batches of each partition.
+  """
+  names = topic_columns(components.shape[0])
+  model = df.sparkSession.sparkContext.broadcast(
+    (vectorizer, np.ascontiguousarray(components, dtype=np.float64), idf))
+  schema = StructType([StructField(name, DoubleType()) for name in names])
+
+  @F.pandas_udf(schema)
+  def _score(batches: Iterator[pd.Series]) -> Iterator[pd.DataFrame]:
+    # Only NumPy, pandas and Scikit-Learn are referenced here, so executors do
+    # not need the lsa package on their path.
+    from sklearn.preprocessing import normalize
+
+    batch_vectorizer, batch_components, batch_idf = model.value
+    for texts in batches:
+      X = batch_vectorizer.transform(texts.fillna(""))
+      if batch_idf is not None:
+        X = X.astype(np.float64)
+        X.data *= batch_idf[X.indices]
+        X = normalize(X, copy=False)
+      yield pd.DataFrame(np.asarray(X @ batch_components.T), columns=names)
+
+  scoredDF = df.withColumn("_topics", _score(F.col(text_col)))
+  return scoredDF.select(*([F.col(c) for c in df.columns]
+                           + [F.col("_topics")[name].alias(name) for name in names]))
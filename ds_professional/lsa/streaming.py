@@ -0,0 +1,110 @@
+"""
+Out-of-core construction of the document-term matrix.
+
+The body is read in fixed-size chunks through a generator and the sparse
+document-term matrix is assembled chunk by chunk, so peak memory is set by
+the chunk size and the size of the output rather than by the raw corpus.
+"""
+
+import csv
+import heapq
+from collections import Counter
+
+import numpy as np
+import scipy.sparse as sp
+from sklearn.feature_extraction.text import CountVectorizer, HashingVectorizer
+
+
+def iter_text_chunks(source, chunk_size=10000, text_col="sentence"):
+  """
+  Yield lists of at most ``chunk_size`` documents from ``source``.
+
+  ``source`` is either a path or an iterable of strings. A ``.csv`` path is
+  read with its header and ``text_col`` is used; any other path is read as one
+  document per line.
+  """
+  if isinstance(source, str):
+    with open(source, newline="", encoding="utf-8") as handle:
+      if source.endswith(".csv"):
+        documents = (row[text_col] or "" for row in csv.DictReader(handle))
+      else:
+        documents = (line.rstrip("\r\n") for line in handle)
+      yield from _chunked(documents, chunk_size)
+  else:
+    yield from _chunked(source, chunk_size)
+
+
+def _chunked(documents, chunk_size):
+  chunk = []
+  for document in documents:
+    chunk.append(document)
+    if len(chunk) == chunk_size:
+      yield chunk
+      chunk = []
+  if chunk:
+    yield chunk
+
+
+def _count_document_frequencies(chunks, analyzer, max_vocab=None):
+  # Space-bounded document frequency count. With ``max_vocab`` set the table
+  # is pruned back to its ``max_vocab`` most frequent terms whenever it grows
+  # past twice that size, so rare terms seen early may be under-counted.
+  document_frequency = Counter()
+  for chunk in chunks:
+    for document in chunk:
+      document_frequency.update(set(analyzer(document)))
+    if max_vocab is not None and len(document_frequency) > 2 * max_vocab:
+      document_frequency = Counter(dict(
+        heapq.nlargest(max_vocab, document_frequency.items(), key=lambda item: item[1])))
+  return document_frequency
+
+
+def _stack_csr(blocks, n_features, dtype):
+  # One concatenation of the per-chunk CSR arrays instead of repeated vstacks.
+  if not blocks:
+    return sp.csr_matrix((0, n_features), dtype=dtype)
+  indptr = [np.zeros(1, dtype=np.int64)]
+  offset = 0
+  for block in blocks:
+    indptr.append(block.indptr[1:].astype(np.int64) + offset)
+    offset += block.nnz
+  indices = np.concatenate([block.indices for block in blocks])
+  data = np.concatenate([block.data for block in blocks]).astype(dtype, copy=False)
+  indptr = np.concatenate(indptr)
+  if offset <= np.iinfo(np.int32).max:
+    indptr = indptr.astype(np.int32)
+  return sp.csr_matrix((data, indices, indptr), shape=(len(indptr) - 1, n_features))
+
+
+def stream_document_term_matrix(source, chunk_size=10000, text_col="sentence", mode="prune",
+                                min_df=1, max_features=None, stop_words="english",
+                                max_vocab=None, n_features=1 << 20, dtype=np.int64):
+  """
+  Build the document-term matrix of ``source`` without loading it at once.
+
+  ``mode="prune"`` makes two passes: the first counts document frequencies
+  (bounded by ``max_vocab``) and prunes the dictionary with ``min_df`` and
+  ``max_features``, the second fills the matrix. ``mode="hash"`` makes a
+  single pass into ``n_features`` hashed columns and keeps no dictionary.
+
+  Returns ``(vectorizer, bag_of_words)`` like ``vectorizer.fit_transform``.
+  ``source`` must be re-iterable (a path or a list) for ``mode="prune"``.
+  """
+  if mode == "hash":
+    vectorizer = HashingVectorizer(n_features=n_features, stop_words=stop_words,
+                                   alternate_sign=False, norm=None, dtype=dtype)
+  elif mode == "prune":
+    analyzer = CountVectorizer(stop_words=stop_words).build_analyzer()
+    document_frequency = _count_document_frequencies(
+      iter_text_chunks(source, chunk_size, text_col), analyzer, max_vocab)
+    kept = {term: count for term, count in document_frequency.items() if count >= min_df}
+    del document_frequency
+    if max_features is not None and len(kept) > max_features:
+      kept = dict(heapq.nlargest(max_features, kept.items(), key=lambda item: item[1]))
+    vectorizer = CountVectorizer(stop_words=stop_words, vocabulary=sorted(kept), dtype=dtype)
+    n_features = len(kept)
+  else:
+    raise ValueError("mode must be 'prune' or 'hash', got {!r}".format(mode))
+
+  blocks = [vectorizer.transform(chunk) for chunk in iter_text_chunks(source, chunk_size, text_col)]
+  return vectorizer, _stack_csr(blocks, n_features, dtype)
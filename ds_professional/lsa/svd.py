@@ -0,0 +1,175 @@
+"""
+A truncated SVD engine for refitting topics as the body grows.
+
+``IncrementalTruncatedSVD`` is a drop-in replacement for Scikit-Learn's
+``TruncatedSVD`` in the notebook that adds
+
+- a randomized range finder with a configurable number of power iterations,
+- ``partial_fit`` to update the rank-k topic space when rows are appended,
+- ``warm_start`` from ``components_`` persisted by an earlier run.
+"""
+
+import numpy as np
+import scipy.linalg
+import scipy.sparse as sp
+from sklearn.base import BaseEstimator, TransformerMixin
+from sklearn.utils import check_random_state
+from sklearn.utils.extmath import safe_sparse_dot
+
+
+def flip_signs(components):
+  """
+  Make the largest-magnitude loading of every topic positive.
+
+  This is the sign convention of Scikit-Learn's ``TruncatedSVD``; applying it
+  everywhere keeps topics comparable between refits.
+  """
+  max_abs_cols = np.argmax(np.abs(components), axis=1)
+  signs = np.sign(components[np.arange(components.shape[0]), max_abs_cols])
+  signs[signs == 0] = 1
+  return components * signs[:, np.newaxis]
+
+
+def _orthonormalize(Y, normalizer):
+  if normalizer == "QR":
+    return scipy.linalg.qr(Y, mode="economic", check_finite=False)[0]
+  if normalizer == "LU":
+    return scipy.linalg.lu(Y, permute_l=True, check_finite=False)[0]
+  return Y
+
+
+def randomized_range(X, basis, n_iter, normalizer="QR"):
+  """
+  Orthonormal basis for the range of ``X`` started from the columns of ``basis``.
+
+  ``basis`` is a V x l matrix, either Gaussian noise or the previous components
+  for a warm start; each power iteration sharpens it towards the top singular
+  subspace.
+  """
+  Q = safe_sparse_dot(X, basis)
+  for _ in range(n_iter):
+    Q = _orthonormalize(Q, normalizer)
+    Q = _orthonormalize(safe_sparse_dot(X.T, Q), normalizer)
+    Q = safe_sparse_dot(X, Q)
+  return scipy.linalg.qr(Q, mode="economic", check_finite=False)[0]
+
+
+class IncrementalTruncatedSVD(TransformerMixin, BaseEstimator):
+  """
+  Truncated SVD by randomized range finding with incremental updates.
+
+  Parameters follow ``sklearn.decomposition.TruncatedSVD``; with
+  ``warm_start=True`` a fit starts its power iterations from the current
+  ``components_`` instead of random noise, which usually needs fewer
+  ``n_iter`` to converge after a small change to the body.
+  """
+
+  def __init__(self, n_components=2, n_oversamples=10, n_iter=5,
+               power_iteration_normalizer="QR", warm_start=False, random_state=None):
+    self.n_components = n_components
+    self.n_oversamples = n_oversamples
+    self.n_iter = n_iter
+    self.power_iteration_normalizer = power_iteration_normalizer
+    self.warm_start = warm_start
+    self.random_state = random_state
+
+  def _initial_basis(self, n_features, n_random):
+    random_state = check_random_state(self.random_state)
+    noise = random_state.normal(size=(n_features, n_random))
+    if self.warm_start and hasattr(self, "components_"):
+      if self.components_.shape[1] != n_features:
+        raise ValueError("warm_start components have {} terms but X has {}".format(
+          self.components_.shape[1], n_features))
+      return np.hstack([self.components_.T, noise[:, :max(n_random - self.components_.shape[0], 0)]])
+    return noise
+
+  def _decompose(self, X):
+    n_rows, n_features = X.shape
+    rank = min(self.n_components + self.n_oversamples, n_rows, n_features)
+    # float32 input is factorized in float32 throughout; anything else in float64.
+    dtype = np.float32 if X.dtype == np.float32 else np.float64
+    basis = self._initial_basis(n_features, rank).astype(dtype, copy=False)
+    Q = randomized_range(X, basis, self.n_iter, self.power_iteration_normalizer)
+    B = safe_sparse_dot(Q.T, X)
+    if sp.issparse(B):
+      B = B.toarray()
+    _, singular_values, Vt = scipy.linalg.svd(B, full_matrices=False, check_finite=False)
+    k = self.n_components
+    self.components_ = flip_signs(Vt[:k])
+    self.singular_values_ = singular_values[:k]
+
+  def _update_moments(self, X):
+    # Running column sums and total sum of squares are all that is needed for
+    # explained_variance_ratio_ without keeping the rows that were seen.
+    column_sum = np.asarray(X.sum(axis=0, dtype=np.float64)).ravel()
+    values = sp.csr_matrix(X).data if sp.issparse(X) else np.ravel(X)
+    sq_sum = float(np.dot(values, values))
+    if getattr(self, "n_samples_seen_", 0):
+      self.column_sum_ = self.column_sum_ + column_sum
+      self.sq_sum_ += sq_sum
+      self.n_samples_seen_ += X.shape[0]
+    else:
+      self.column_sum_ = column_sum
+      self.sq_sum_ = sq_sum
+      self.n_samples_seen_ = X.shape[0]
+    self._update_variance()
+
+  def _update_variance(self):
+    n = self.n_samples_seen_
+    mean = self.column_sum_ / n
+    total_variance = self.sq_sum_ / n - mean.dot(mean)
+    topic_means = self.components_.dot(mean)
+    self.explained_variance_ = self.singular_values_ ** 2 / n - topic_means ** 2
+    self.explained_variance_ratio_ = self.explained_variance_ / total_variance
+
+  def fit(self, X, y=None):
+    self.n_samples_seen_ = 0
+    self._decompose(X)
+    self._update_moments(X)
+    return self
+
+  def partial_fit(self, X, y=None):
+    """
+    Update the rank-k topic space with the appended rows ``X``.
+
+    The rows seen so far are summarized by ``diag(singular_values_) @
+    components_``; stacking that summary on top of ``X`` and refactorizing
+    gives the rank-k SVD of the grown body without revisiting old rows.
+    """
+    if not hasattr(self, "components_"):
+      return self.fit(X)
+    summary = self.singular_values_[:, np.newaxis] * self.components_
+    stacked = sp.vstack([sp.csr_matrix(summary), sp.csr_matrix(X)], format="csr")
+    warm_start = self.warm_start
+    self.warm_start = True
+    try:
+      self._decompose(stacked)
+    finally:
+      self.warm_start = warm_start
+    self._update_moments(X)
+    return self
+
+  def transform(self, X):
+    return safe_sparse_dot(X, self.components_.T)
+
+  def fit_transform(self, X, y=None):
+    return self.fit(X).transform(X)
+
+  def save(self, path):
+    """Persist the fitted topic space so a later run can warm start from it."""
+    np.savez(path, components=self.components_, singular_values=self.singular_values_,
+             column_sum=self.column_sum_, sq_sum=self.sq_sum_, n_samples_seen=self.n_samples_seen_)
+
+  @classmethod
+  def load(cls, path, **params):
+    """Restore a topic space written by ``save``; ``params`` go to the constructor."""
+    with np.load(path) as state:
+      params.setdefault("n_components", state["components"].shape[0])
+      svd = cls(**params)
+      svd.components_ = state["components"]
+      svd.singular_values_ = state["singular_values"]
+      svd.column_sum_ = state["column_sum"]
+      svd.sq_sum_ = float(state["sq_sum"])
+      svd.n_samples_seen_ = int(state["n_samples_seen"])
+    svd._update_variance()
+    return svd
@@ -0,0 +1,225 @@
+"""
+A tokenization engine for the LSA pipeline with configurable n-grams, stop
+lists and token normalizers.
+
+``TokenizationEngine`` resolves every distinct raw token once: lowercasing
+and the regular expression run per document, but the normalizers (accent
+stripping, stemming, ...), the stop-word test and the lookup of the term's
+column are all folded into one table from raw token to term id, so each
+further occurrence of the token costs a single dict lookup. N-grams are
+looked up the same way, by the tuple of their unigram ids. Term strings are
+interned in one table shared by every n-gram order.
+
+``count`` vectorizes a whole batch of documents into a CSR matrix in one
+pass, with the same dictionary and matrix as ``CountVectorizer``;
+``as_analyzer`` plugs the engine into ``CountVectorizer`` (or
+``parallel_count_vectorize``) instead.
+
+The tables only pay off once they hold most of the tokens. On a single
+pass over fresh tables the engine is barely faster than ``CountVectorizer``:
+1.03x to 1.3x for unigrams and about 1.09x with bigrams in our measurements.
+The larger speedups (about 2x with bigrams) are those of later batches over
+the same vocabulary, as in a long-running job. The tables are cleared by
+``reset`` and, once they hold more than ``max_table_size`` entries, before
+the next batch.
+"""
+
+import re
+import sys
+import unicodedata
+from array import array
+
+import numpy as np
+import scipy.sparse as sp
+from sklearn.feature_extraction.text import ENGLISH_STOP_WORDS
+
+# Same token definition as the Scikit-Learn default analyzer: words of two or
+# more unicode word characters.
+TOKEN_PATTERN = r"(?u)\b\w\w+\b"
+
+STOP_WORDS = {"english": ENGLISH_STOP_WORDS}
+
+# The id of a raw token that is not a term: a stop word, or dropped by a normalizer.
+_SKIP = -1
+
+
+def strip_accents(token):
+  """``token`` without combining accents, like ``strip_accents='unicode'``."""
+  normalized = unicodedata.normalize("NFKD", token)
+  if normalized == token:
+    return token
+  return "".join(c for c in normalized if not unicodedata.combining(c))
+
+
+def stop_list(stop_words):
+  """A frozenset of stop words from a language name in ``STOP_WORDS``, an iterable or None."""
+  if stop_words is None:
+    return frozenset()
+  if isinstance(stop_words, str):
+    try:
+      return frozenset(STOP_WORDS[stop_words])
+    except KeyError:
+      raise ValueError("no stop list for {!r}, expected one of {}".format(stop_words, sorted(STOP_WORDS)))
+  return frozenset(stop_words)
+
+
+class _TokenTable(dict):
+  # Raw token -> term id; a raw token is only resolved on its first occurrence.
+  def __init__(self, engine):
+    super().__init__()
+    self.engine = engine
+
+  def __missing__(self, token):
+    term_id = self[token] = self.engine._resolve(token)
+    return term_id
+
+
+class _NgramTable(dict):
+  # Tuple of unigram ids -> term id of the n-gram.
+  def __init__(self, engine):
+    super().__init__()
+    self.engine = engine
+
+  def __missing__(self, ids):
+    terms = self.engine.terms
+    term_id = self[ids] = self.engine._intern(" ".join(terms[i] for i in ids))
+    return term_id
+
+
+class TokenizationEngine:
+  """
+  Tokenizer, stop list, normalizers and n-grams behind one lookup table.
+
+  A document is lowercased (with ``lowercase``), split with ``token_pattern``
+  and every token is passed through ``normalizers`` in order; a normalizer
+  returns the new token, or a false value to drop it (a stemmer such as
+  ``nltk``'s ``PorterStemmer().stem`` fits). Tokens that are in
+  ``stop_words`` after normalization are dropped. N-grams of
+  ``ngram_range`` are formed from the remaining tokens, as in
+  ``CountVectorizer``. For the engine to be pickled (e.g. by
+  ``parallel_count_vectorize``) the normalizers must be module-level
+  functions.
+
+  The lookup tables are a cache that grows with every new token and n-gram.
+  When they hold more than ``max_table_size`` entries they are cleared
+  before the next batch of ``count`` or document of the analyzer; None
+  lets them grow without bound.
+  """
+
+  def __init__(self, token_pattern=TOKEN_PATTERN, lowercase=True, stop_words="english", ngram_range=(1, 1),
+               normalizers=(), max_table_size=1 << 21):
+    self.token_pattern = token_pattern
+    self.lowercase = lowercase
+    self.stop_words = stop_list(stop_words)
+    self.ngram_range = tuple(ngram_range)
+    self.normalizers = tuple(normalizers)
+    self.max_table_size = max_table_size
+    if not 1 <= self.ngram_range[0] <= self.ngram_range[1]:
+      raise ValueError("invalid ngram_range {}".format(self.ngram_range))
+    self._findall = re.compile(self.token_pattern).findall
+    self.reset()
+
+  def reset(self):
+    """Empty the lookup tables; term ids handed out before are no longer valid."""
+    self.terms = []
+    self.term_ids = {}
+    self._tokens = _TokenTable(self)
+    self._ngrams = _NgramTable(self)
+
+  @property
+  def table_size(self):
+    """Entries in the lookup tables: raw tokens, n-grams and interned terms."""
+    return len(self._tokens) + len(self._ngrams) + len(self.terms)
+
+  def _limit_tables(self):
+    if self.max_table_size is not None and self.table_size > self.max_table_size:
+      self.reset()
+
+  def __getstate__(self):
+    # The tables are a cache: ship the configuration only.
+    return {"token_pattern": self.token_pattern, "lowercase": self.lowercase, "stop_words": self.stop_words,
+            "ngram_range": self.ngram_range, "normalizers": self.normalizers,
+            "max_table_size": self.max_table_size}
+
+  def __setstate__(self, state):
+    self.__dict__.update(state)
+    self._findall = re.compile(self.token_pattern).findall
+    self.reset()
+
+  def _intern(self, term):
+    term_id = self.term_ids.get(term)
+    if term_id is None:
+      term_id = self.term_ids[sys.intern(term)] = len(self.terms)
+      self.terms.append(term)
+    return term_id
+
+  def _resolve(self, token):
+    # Stop words are tested on the normalized token, as CountVectorizer tests
+    # them after strip_accents; the table then caches the outcome.
+    for normalize in self.normalizers:
+      token = normalize(token)
+      if not token:
+        return _SKIP
+    if token in self.stop_words:
+      return _SKIP
+    return self._intern(token)
+
+  def _unigram_ids(self, document):
+    if self.lowercase:
+      document = document.lower()
+    return list(map(self._tokens.__getitem__, self._findall(document)))
+
+  def term_ids_of(self, document):
+    """Term ids of the unigrams and n-grams of ``document``, in ``CountVectorizer`` order."""
+    ids = [i for i in self._unigram_ids(document) if i != _SKIP]
+    low, high = self.ngram_range
+    if high == 1:
+      return ids
+    terms = ids[:] if low == 1 else []
+    lookup = self._ngrams.__getitem__
+    for n in range(max(low, 2), min(high, len(ids)) + 1):
+      terms.extend(map(lookup, zip(*[ids[k:] for k in range(n)])))
+    return terms
+
+  def __call__(self, document):
+    """The terms of ``document``; this is the analyzer returned by ``as_analyzer``."""
+    self._limit_tables()
+    terms = self.terms
+    return [terms[i] for i in self.term_ids_of(document)]
+
+  def as_analyzer(self):
+    """A callable for ``CountVectorizer(analyzer=...)``."""
+    return self
+
+  def count(self, documents):
+    """
+    Vectorize a batch of ``documents``.
+
+    Returns ``(terms, counts)`` like ``CountVectorizer(analyzer=...)``'s
+    ``get_feature_names_out()`` and ``fit_transform``: terms are sorted and
+    ``counts`` is an int64 CSR matrix over them. The term ids of the whole
+    batch are collected into one flat array and summed per document at once;
+    only the terms that occur in the batch are sorted, not the whole table.
+    """
+    self._limit_tables()
+    term_ids = array("q")
+    lengths = array("q")
+    for document in documents:
+      ids = self.term_ids_of(document)
+      term_ids.extend(ids)
+      lengths.append(len(ids))
+    term_ids = np.frombuffer(term_ids, dtype=np.int64) if len(term_ids) else np.zeros(0, dtype=np.int64)
+    lengths = np.frombuffer(lengths, dtype=np.int64) if len(lengths) else np.zeros(0, dtype=np.int64)
+
+    # Only the terms that occur in this batch, as CountVectorizer would see them.
+    present, position = np.unique(term_ids, return_inverse=True)
+    all_terms = self.terms
+    terms = np.asarray([all_terms[i] for i in present], dtype=object)
+    order = np.argsort(terms.astype(str), kind="stable")
+    column = np.empty(len(order), dtype=np.int64)
+    column[order] = np.arange(len(order))
+    rows = np.repeat(np.arange(len(lengths)), lengths)
+    counts = sp.csr_matrix((np.ones(len(term_ids), dtype=np.int64), (rows, column[position])),
+                           shape=(len(lengths), len(terms)))
+    counts.sum_duplicates()
+    return terms[order], counts
@@ -0,0 +1,60 @@
+"""
+Interpreting the topics of a fitted SVD.
+
+``top_terms`` finds the top terms of every topic with one ``argpartition``
+over ``svd.components_`` instead of sorting a terms x topics DataFrame once
+per topic, and only ever builds a table of the selected terms.
+"""
+
+import numpy as np
+import pandas as pd
+
+_RANKINGS = ("absolute", "positive", "negative")
+
+
+def topic_columns(n_components):
+  """The notebook's column names for the topics: ``topic_1 .. topic_k``."""
+  return ["topic_{}".format(i + 1) for i in range(n_components)]
+
+
+def top_term_indices(components, n_terms=10, ranking="absolute"):
+  """
+  Column indices of the top ``n_terms`` terms of every topic, best first.
+
+  ``ranking`` is ``"absolute"`` (largest magnitude, as the notebook's
+  ``abs_topic_*`` columns), ``"positive"`` or ``"negative"`` (largest weights
+  of that sign).
+  """
+  if ranking not in _RANKINGS:
+    raise ValueError("ranking must be one of {}, got {!r}".format(_RANKINGS, ranking))
+  components = np.asarray(components)
+  if ranking == "absolute":
+    scores = np.abs(components)
+  elif ranking == "positive":
+    scores = components
+  else:
+    scores = -components
+  n_terms = min(n_terms, components.shape[1])
+  top = np.argpartition(-scores, n_terms - 1, axis=1)[:, :n_terms]
+  order = np.argsort(-np.take_along_axis(scores, top, axis=1), axis=1, kind="stable")
+  return np.take_along_axis(top, order, axis=1)
+
+
+def top_terms(components, dictionary, n_terms=10, ranking="absolute", topic_names=None):
+  """
+  A long DataFrame of the top ``n_terms`` terms and weights of every topic.
+
+  The columns are ``topic``, ``rank``, ``terms`` and ``weight`` (the signed
+  value from ``components``), with ``n_topics * n_terms`` rows.
+  """
+  components = np.asarray(components)
+  n_topics = components.shape[0]
+  topic_names = topic_names or topic_columns(n_topics)
+  top = top_term_indices(components, n_terms=n_terms, ranking=ranking)
+  n_terms = top.shape[1]
+  dictionary = np.asarray(dictionary, dtype=object)
+  return pd.DataFrame({
+    "topic": np.repeat(np.asarray(topic_names, dtype=object), n_terms),
+    "rank": np.tile(np.arange(1, n_terms + 1), n_topics),
+    "terms": dictionary[top.ravel()],
+    "weight": np.take_along_axis(components, top, axis=1).ravel()})
@@ -0,0 +1,171 @@
+"""
+Document-term matrices for the notebook's count and TF-IDF analyses.
+
+The TF-IDF matrix is derived from the count matrix instead of tokenizing the
+body a second time with ``TfidfVectorizer``: both weightings share one
+tokenization pass and one dictionary. The tokenization pass itself can be
+sharded across a pool of processes with ``parallel_count_vectorize``.
+"""
+
+import os
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from numbers import Integral
+
+import numpy as np
+import scipy.sparse as sp
+from sklearn.feature_extraction.text import CountVectorizer
+from sklearn.preprocessing import normalize
+
+from lsa.streaming import _stack_csr
+
+DocumentTermMatrices = namedtuple("DocumentTermMatrices", ["vectorizer", "counts", "tfidf", "idf"])
+
+
+def inverse_document_frequency(counts, smooth_idf=True):
+  """The ``TfidfTransformer`` idf weights of a CSR count matrix."""
+  counts = sp.csr_matrix(counts)
+  n_documents = counts.shape[0]
+  # Rows of a CSR matrix from CountVectorizer hold each term once, so counting
+  # column indices counts documents.
+  document_frequency = np.bincount(counts.indices, minlength=counts.shape[1])
+  smooth = int(smooth_idf)
+  return np.log((n_documents + smooth) / (document_frequency + smooth)) + 1
+
+
+def tfidf_from_counts(counts, idf=None, norm="l2", use_idf=True, smooth_idf=True, sublinear_tf=False):
+  """
+  Rescale a count matrix into the matrix ``TfidfVectorizer`` would return.
+
+  The rescale is a single vectorized pass over the non-zero values; pass the
+  ``idf`` of a previous call to weight new documents with the same idf.
+  """
+  counts = sp.csr_matrix(counts)
+  # float32 counts stay float32, everything else is weighted in float64.
+  tfidf = counts.astype(np.float32 if counts.dtype == np.float32 else np.float64)
+  if sublinear_tf:
+    np.log(tfidf.data, out=tfidf.data)
+    tfidf.data += 1
+  if use_idf:
+    if idf is None:
+      idf = inverse_document_frequency(counts, smooth_idf=smooth_idf)
+    tfidf.data *= idf.astype(tfidf.dtype, copy=False)[tfidf.indices]
+  if norm:
+    tfidf = normalize(tfidf, norm=norm, copy=False)
+  return tfidf
+
+
+def compact_indices(X):
+  """``X`` with int32 ``indices`` and ``indptr`` whenever they fit, without copying the values."""
+  X = sp.csr_matrix(X)
+  if X.indices.dtype != np.int32 and max(X.nnz, X.shape[1]) <= np.iinfo(np.int32).max:
+    X = sp.csr_matrix((X.data, X.indices.astype(np.int32), X.indptr.astype(np.int32)), shape=X.shape)
+  return X
+
+
+def _vectorize_shard(documents, params):
+  # Every shard keeps all of its terms; the dictionary is pruned only once the
+  # document frequencies of the whole body are known.
+  vectorizer = CountVectorizer(**dict(params, min_df=1, max_df=1.0, max_features=None))
+  try:
+    counts = vectorizer.fit_transform(documents)
+  except ValueError as error:
+    if "empty vocabulary" not in str(error):
+      raise
+    # A shard with no terms at all, e.g. only stop words.
+    return np.empty(0, dtype=object), sp.csr_matrix((len(documents), 0), dtype=_counts_dtype(params))
+  return vectorizer.get_feature_names_out(), counts
+
+
+def _counts_dtype(params):
+  return params.get("dtype", np.int64)
+
+
+def _limit_features(counts, terms, max_df, min_df, max_features):
+  # The same pruning as CountVectorizer.fit_transform, applied to the merged
+  # matrix, so the result does not depend on how the body was sharded.
+  n_documents = counts.shape[0]
+  max_doc_count = max_df if isinstance(max_df, Integral) else max_df * n_documents
+  min_doc_count = min_df if isinstance(min_df, Integral) else min_df * n_documents
+  if max_doc_count < min_doc_count:
+    raise ValueError("max_df corresponds to < documents than min_df")
+  document_frequency = np.bincount(counts.indices, minlength=counts.shape[1])
+  mask = (document_frequency <= max_doc_count) & (document_frequency >= min_doc_count)
+  if max_features is not None and mask.sum() > max_features:
+    term_frequency = np.asarray(counts.sum(axis=0)).ravel()
+    keep = (-term_frequency[mask]).argsort()[:max_features]
+    limited = np.zeros(len(mask), dtype=bool)
+    limited[np.where(mask)[0][keep]] = True
+    mask = limited
+  kept = np.where(mask)[0]
+  if len(kept) == 0:
+    raise ValueError("After pruning, no terms remain. Try a lower min_df or a higher max_df.")
+  return counts[:, kept], terms[kept]
+
+
+def parallel_count_vectorize(documents, n_jobs=None, n_shards=None, **count_params):
+  """
+  ``CountVectorizer(**count_params).fit_transform(documents)`` on a process pool.
+
+  The body is split into ``n_shards`` contiguous shards (one per worker by
+  default). Each worker tokenizes its shard into a partial dictionary and CSR
+  block; the partial dictionaries are merged into one sorted dictionary, the
+  blocks are re-indexed into it and stacked, and ``min_df``, ``max_df`` and
+  ``max_features`` are applied to the merged matrix. The result is identical
+  to the serial ``CountVectorizer``. ``count_params`` must be picklable, so a
+  custom ``analyzer`` or ``tokenizer`` has to be a module-level function.
+
+  Returns ``(vectorizer, counts)``.
+  """
+  documents = list(documents)
+  n_jobs = n_jobs or os.cpu_count() or 1
+  n_shards = max(1, min(n_shards or n_jobs, len(documents)))
+  bounds = np.linspace(0, len(documents), n_shards + 1).astype(int)
+  shards = [documents[start:stop] for start, stop in zip(bounds[:-1], bounds[1:])]
+
+  if n_jobs == 1:
+    partials = [_vectorize_shard(shard, count_params) for shard in shards]
+  else:
+    with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+      partials = list(pool.map(_vectorize_shard, shards, [count_params] * len(shards)))
+
+  # Merged as Python strings: a fixed-width unicode array would be as wide as
+  # the longest term for every term, which is costly for large dictionaries.
+  terms = sorted(set().union(*[shard_terms for shard_terms, _ in partials]))
+  column_of = {term: column for column, term in enumerate(terms)}
+  terms = np.asarray(terms, dtype=object)
+  blocks = []
+  for shard_terms, block in partials:
+    column_map = np.fromiter(map(column_of.__getitem__, shard_terms), dtype=np.int64, count=len(shard_terms))
+    blocks.append(sp.csr_matrix((block.data, column_map[block.indices], block.indptr),
+                                shape=(block.shape[0], len(terms))))
+  counts = _stack_csr(blocks, len(terms), _counts_dtype(count_params))
+
+  params = CountVectorizer(**count_params).get_params()
+  counts, terms = _limit_features(counts, terms, params["max_df"], params["min_df"],
+                                  params["max_features"])
+  vectorizer = CountVectorizer(**count_params)
+  vectorizer.vocabulary_ = {term: index for index, term in enumerate(terms)}
+  vectorizer.fixed_vocabulary_ = False
+  return vectorizer, counts
+
+
+def fused_count_tfidf(documents, norm="l2", use_idf=True, smooth_idf=True, sublinear_tf=False,
+                      n_jobs=None, **count_params):
+  """
+  Tokenize ``documents`` once and return both the count and TF-IDF matrices.
+
+  ``count_params`` go to ``CountVectorizer`` (e.g. ``min_df=1,
+  stop_words='english'``); the TF-IDF options are those of ``TfidfVectorizer``.
+  With ``n_jobs`` > 1 the tokenization runs on ``parallel_count_vectorize``.
+  Pass ``dtype=np.float32`` to keep both matrices in single precision.
+  """
+  if n_jobs is not None and n_jobs > 1:
+    vectorizer, counts = parallel_count_vectorize(documents, n_jobs=n_jobs, **count_params)
+  else:
+    vectorizer = CountVectorizer(**count_params)
+    counts = vectorizer.fit_transform(documents)
+  counts = compact_indices(counts)
+  idf = inverse_document_frequency(counts, smooth_idf=smooth_idf) if use_idf else None
+  tfidf = tfidf_from_counts(counts, idf=idf, norm=norm, use_idf=use_idf, sublinear_tf=sublinear_tf)
+  return DocumentTermMatrices(vectorizer, counts, tfidf, idf)
@@ -0,0 +1,23 @@
+import os
+import sys
+
+import pytest
+
+# The notebook imports the helpers as ``lsa.<module>`` from the folder next
+# to it; the tests do the same.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# A few lines of both poems, shared by the tests that need a small body.
+SENTENCES = ["Once upon a midnight dreary, while I pondered, weak and weary",
+             "Quoth the Raven, Nevermore.",
+             "Half a league, half a league, half a league onward",
+             "All in the valley of Death rode the six hundred.",
+             "And the Raven, never flitting, still is sitting, still is sitting",
+             "Cannon to right of them, cannon to left of them",
+             "Ah, distinctly I remember it was in the bleak December",
+             "Theirs not to reason why, theirs but to do and die"]
+
+
+@pytest.fixture
+def sentences():
+  return list(SENTENCES)
@@ -0,0 +1,48 @@
+"""Tests of the fitted-model cache of lsa.cache."""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from lsa import cache as cache_module
+from lsa.cache import ModelCache, cached_lsa
+
+
+def _write_body(path, sentences):
+  pd.DataFrame({"sentence": sentences, "title": "The Raven"}).to_csv(path, index=False)
+
+
+def test_hit_returns_the_fitted_svd(tmp_path, sentences):
+  body_path = str(tmp_path / "body.csv")
+  _write_body(body_path, sentences)
+  model_cache = ModelCache(str(tmp_path / "cache"))
+  params = dict(n_components=2, random_state=0, stop_words="english")
+
+  miss = cached_lsa(model_cache, body_path, **params)
+  hit = cached_lsa(model_cache, body_path, **params)
+  assert not miss.hit and hit.hit
+  assert hit.dictionary == list(miss.dictionary)
+  np.testing.assert_allclose(hit.lsa, miss.lsa)
+  np.testing.assert_allclose(hit.svd.singular_values_, miss.svd.singular_values_)
+  new = np.ones((1, len(hit.dictionary)))
+  np.testing.assert_allclose(hit.svd.transform(new), miss.svd.transform(new))
+
+
+def test_unchanged_files_are_not_hashed_again(tmp_path, sentences, monkeypatch):
+  body_path = str(tmp_path / "body.csv")
+  _write_body(body_path, sentences)
+  model_cache = ModelCache(str(tmp_path / "cache"))
+  first = model_cache.key(body_path, {"n_components": 2})
+
+  hashed = []
+  file_sha256 = cache_module._file_sha256
+  monkeypatch.setattr(cache_module, "_file_sha256", lambda *args: hashed.append(args) or file_sha256(*args))
+  assert model_cache.key(body_path, {"n_components": 2}) == first
+  assert not hashed
+
+  _write_body(body_path, sentences[:-1])
+  stat = os.stat(body_path)
+  os.utime(body_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+  assert model_cache.key(body_path, {"n_components": 2}) != first
+  assert len(hashed) == 1
@@ -0,0 +1,40 @@
+"""Tests of the memory-mapped topic store of lsa.embedding_store."""
+
+import numpy as np
+import pytest
+
+from lsa.embedding_store import EmbeddingStore, write_embedding_store
+
+
+@pytest.fixture
+def store(tmp_path, sentences):
+  embeddings = np.arange(2 * len(sentences), dtype=np.float64).reshape(-1, 2)
+  labels = {"Is_Poe": np.arange(len(sentences)) % 2 == 0, "title": np.where(np.arange(len(sentences)) % 2, "b", "a")}
+  write_embedding_store(str(tmp_path / "store"), embeddings, sentences, labels=labels)
+  return EmbeddingStore(str(tmp_path / "store"))
+
+
+@pytest.mark.parametrize("rows", [slice(None), slice(2, 7, 2), slice(-3, None), [5, 0, -1], np.array([3]), 4, -2])
+def test_rows_select_like_numpy(store, sentences, rows):
+  expected = np.arange(len(sentences))[rows]
+  frame = store.iloc[rows]
+  assert frame.index.tolist() == np.atleast_1d(expected % len(sentences)).tolist()
+  assert frame["sentence"].tolist() == [sentences[i] for i in np.atleast_1d(expected)]
+  np.testing.assert_array_equal(frame["topic_1"].to_numpy(), 2 * np.atleast_1d(expected % len(sentences)))
+  assert frame["title"].tolist() == ["b" if i % 2 else "a" for i in np.atleast_1d(expected % len(sentences))]
+
+
+def test_boolean_mask_and_out_of_range_rows(store, sentences):
+  mask = np.arange(len(sentences)) % 3 == 0
+  assert store.iloc[mask].index.tolist() == np.flatnonzero(mask).tolist()
+  with pytest.raises(IndexError):
+    store.iloc[[len(sentences)]]
+
+
+@pytest.mark.parametrize("extra", [1, -1])
+def test_text_count_must_match_the_embeddings(tmp_path, sentences, extra):
+  texts = sentences + ["one more"] if extra > 0 else sentences[:-1]
+  with pytest.raises(ValueError):
+    write_embedding_store(str(tmp_path / "store"), np.zeros((len(sentences), 2)), texts)
+  with pytest.raises(ValueError):
+    write_embedding_store(str(tmp_path / "store"), np.zeros((len(sentences), 2)), iter(texts))
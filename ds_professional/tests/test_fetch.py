@@ -0,0 +1,201 @@
+"""Tests of lsa.fetch against a local stand-in for the download server."""
+
+import hashlib
+import os
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from lsa.fetch import DownloadCache, fetch
+
+BODY = b"sentence,title\n" + b"".join(b"line %d,The Raven\n" % i for i in range(2000))
+
+
+class _Resource:
+  def __init__(self, body, etag, last_modified=None):
+    self.body = body
+    self.etag = etag
+    self.last_modified = last_modified
+    self.requests = []
+
+  def validators(self):
+    return {value for value in (self.etag, self.last_modified) if value}
+
+
+def _handler(resource):
+  class Handler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+      pass
+
+    def do_GET(self):
+      resource.requests.append(dict(self.headers))
+      if resource.etag and self.headers.get("If-None-Match") == resource.etag:
+        self.send_response(304)
+        self.end_headers()
+        return
+      body, status = resource.body, 200
+      range_header = self.headers.get("Range")
+      if range_header and (self.headers.get("If-Range") is None
+                           or self.headers.get("If-Range") in resource.validators()):
+        start = int(range_header.split("=")[1].rstrip("-"))
+        body, status = body[start:], 206
+      self.send_response(status)
+      if resource.etag:
+        self.send_header("ETag", resource.etag)
+      if resource.last_modified:
+        self.send_header("Last-Modified", resource.last_modified)
+      self.send_header("Content-Length", str(len(body)))
+      self.end_headers()
+      self.wfile.write(body)
+
+  return Handler
+
+
+@pytest.fixture
+def server():
+  resource = _Resource(BODY, '"v1"')
+  httpd = ThreadingHTTPServer(("127.0.0.1", 0), _handler(resource))
+  thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+  thread.start()
+  resource.url = "http://127.0.0.1:{}/body.csv".format(httpd.server_address[1])
+  resource.httpd = httpd
+  yield resource
+  httpd.shutdown()
+  httpd.server_close()
+
+
+def _read(path):
+  with open(path, "rb") as handle:
+    return handle.read()
+
+
+def test_cold_fetch_downloads_and_places_a_verified_copy(server, tmp_path):
+  dest = str(tmp_path / "body.csv")
+  result = fetch(server.url, dest, cache_dir=str(tmp_path / "cache"))
+  assert not result.cache_hit
+  assert result.bytes_downloaded == len(BODY)
+  assert result.sha256 == hashlib.sha256(BODY).hexdigest()
+  assert _read(dest) == BODY
+
+
+def test_unchanged_resource_is_a_304_hit(server, tmp_path):
+  dest, cache_dir = str(tmp_path / "body.csv"), str(tmp_path / "cache")
+  fetch(server.url, dest, cache_dir=cache_dir)
+  result = fetch(server.url, dest, cache_dir=cache_dir)
+  assert result.cache_hit
+  assert result.bytes_downloaded == 0
+  assert server.requests[-1]["If-None-Match"] == '"v1"'
+  assert _read(dest) == BODY
+
+
+def test_hit_does_not_rewrite_an_unchanged_destination(server, tmp_path):
+  dest, cache_dir = str(tmp_path / "body.csv"), str(tmp_path / "cache")
+  fetch(server.url, dest, cache_dir=cache_dir)
+  placed = os.stat(dest)
+  fetch(server.url, dest, cache_dir=cache_dir)
+  assert os.stat(dest).st_ino == placed.st_ino
+
+  with open(dest, "wb") as handle:
+    handle.write(b"edited")
+  fetch(server.url, dest, cache_dir=cache_dir)
+  assert _read(dest) == BODY
+
+
+def test_interrupted_download_resumes_with_a_range_request(server, tmp_path):
+  dest, cache_dir = str(tmp_path / "body.csv"), str(tmp_path / "cache")
+  part_path = DownloadCache(cache_dir).partial_path(server.url)
+  with open(part_path, "wb") as handle:
+    handle.write(BODY[:1000])
+  with open(part_path + ".validator", "w") as handle:
+    handle.write(server.etag)
+
+  result = fetch(server.url, dest, cache_dir=cache_dir)
+  assert server.requests[-1]["Range"] == "bytes=1000-"
+  assert result.bytes_downloaded == len(BODY) - 1000
+  assert _read(dest) == BODY
+
+
+def test_changed_etag_downloads_the_new_version(server, tmp_path):
+  dest, cache_dir = str(tmp_path / "body.csv"), str(tmp_path / "cache")
+  fetch(server.url, dest, cache_dir=cache_dir)
+  server.body, server.etag = BODY + b"one more line,The Raven\n", '"v2"'
+
+  result = fetch(server.url, dest, cache_dir=cache_dir)
+  assert not result.cache_hit
+  assert result.sha256 == hashlib.sha256(server.body).hexdigest()
+  assert _read(dest) == server.body
+  # The 200 answer to the revalidation is the download.
+  assert len(server.requests) == 2
+
+
+def test_resume_falls_back_to_last_modified(server, tmp_path):
+  server.etag, server.last_modified = None, "Mon, 05 Oct 2026 10:00:00 GMT"
+  dest, cache_dir = str(tmp_path / "body.csv"), str(tmp_path / "cache")
+  part_path = DownloadCache(cache_dir).partial_path(server.url)
+  with open(part_path, "wb") as handle:
+    handle.write(BODY[:1000])
+  with open(part_path + ".validator", "w") as handle:
+    handle.write(server.last_modified)
+
+  fetch(server.url, dest, cache_dir=cache_dir)
+  assert server.requests[-1]["If-Range"] == server.last_modified
+  assert _read(dest) == BODY
+
+
+def test_partial_file_without_validator_is_not_resumed(server, tmp_path):
+  dest, cache_dir = str(tmp_path / "body.csv"), str(tmp_path / "cache")
+  with open(DownloadCache(cache_dir).partial_path(server.url), "wb") as handle:
+    handle.write(b"a stale prefix of another version")
+
+  result = fetch(server.url, dest, cache_dir=cache_dir)
+  assert "Range" not in server.requests[-1]
+  assert result.bytes_downloaded == len(BODY)
+  assert _read(dest) == BODY
+
+
+def test_offline_run_serves_the_cached_copy(server, tmp_path):
+  dest, cache_dir = str(tmp_path / "body.csv"), str(tmp_path / "cache")
+  fetch(server.url, dest, cache_dir=cache_dir)
+  server.httpd.shutdown()
+  server.httpd.server_close()
+  os.remove(dest)
+
+  with pytest.warns(UserWarning, match="could not revalidate"):
+    result = fetch(server.url, dest, cache_dir=cache_dir, timeout=1)
+  assert result.cache_hit and result.offline
+  assert _read(dest) == BODY
+
+
+def test_revalidated_hit_is_not_offline(server, tmp_path):
+  dest, cache_dir = str(tmp_path / "body.csv"), str(tmp_path / "cache")
+  fetch(server.url, dest, cache_dir=cache_dir)
+  result = fetch(server.url, dest, cache_dir=cache_dir)
+  assert result.cache_hit and not result.offline
+
+
+def test_unresponsive_server_serves_the_cached_copy(server, tmp_path):
+  dest, cache_dir = str(tmp_path / "body.csv"), str(tmp_path / "cache")
+  fetch(server.url, dest, cache_dir=cache_dir)
+  port = server.httpd.server_address[1]
+  server.httpd.shutdown()
+  server.httpd.server_close()
+
+  # Accepts connections on the same port but never answers.
+  silent = socket.socket()
+  silent.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+  silent.bind(("127.0.0.1", port))
+  silent.listen(1)
+  try:
+    with pytest.warns(UserWarning, match="could not revalidate"):
+      result = fetch(server.url, dest, cache_dir=cache_dir, timeout=0.5)
+  finally:
+    silent.close()
+  assert result.cache_hit and result.offline
+  assert _read(dest) == BODY
+
+
+def test_pinned_sha256_mismatch_raises(server, tmp_path):
+  with pytest.raises(IOError):
+    fetch(server.url, str(tmp_path / "body.csv"), sha256="0" * 64, cache_dir=str(tmp_path / "cache"))
@@ -0,0 +1,83 @@
+"""Tests of the append-only TF-IDF of lsa.incremental."""
+
+import os
+
+import numpy as np
+import pytest
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from lsa.incremental import IncrementalTfidf
+
+
+def _assert_matches_a_refit(incremental, documents):
+  reference = TfidfVectorizer(stop_words="english")
+  expected = reference.fit_transform(documents)
+  order = [incremental.vocabulary_[term] for term in reference.get_feature_names_out()]
+  np.testing.assert_allclose(incremental.tfidf[:, order].toarray(), expected.toarray(), atol=1e-12)
+
+
+def test_appends_match_a_refit(sentences):
+  incremental = IncrementalTfidf(stop_words="english")
+  for start in range(0, len(sentences), 3):
+    incremental.append(sentences[start:start + 3])
+  _assert_matches_a_refit(incremental, sentences)
+
+
+def test_load_reads_the_rows_only_when_they_are_needed(tmp_path, sentences):
+  path = str(tmp_path / "tfidf")
+  incremental = IncrementalTfidf(stop_words="english")
+  incremental.append(sentences[:4])
+  incremental.save(path)
+
+  loaded = IncrementalTfidf.load(path)
+  np.testing.assert_array_equal(loaded.document_frequency_, incremental.document_frequency_)
+  loaded.append(sentences[4:6])
+  loaded.transform(["the raven"])
+  loaded.save(path)
+  assert loaded._block_files
+
+  loaded = IncrementalTfidf.load(path)
+  loaded.append(sentences[6:])
+  _assert_matches_a_refit(loaded, sentences)
+  assert not loaded._block_files
+
+
+def test_save_keeps_a_single_document_frequency_file(tmp_path, sentences):
+  path = str(tmp_path / "tfidf")
+  incremental = IncrementalTfidf(stop_words="english")
+  for start in range(0, len(sentences), 2):
+    incremental.append(sentences[start:start + 2])
+    incremental.save(path)
+  names = [name for name in os.listdir(path) if name.startswith("document_frequency")]
+  assert len(names) == 1
+  np.testing.assert_array_equal(IncrementalTfidf.load(path).document_frequency_, incremental.document_frequency_)
+
+
+def test_a_fresh_instance_does_not_merge_into_an_existing_store(tmp_path, sentences):
+  path = str(tmp_path / "tfidf")
+  for _ in range(2):
+    incremental = IncrementalTfidf(stop_words="english")
+    incremental.append(sentences[:4])
+    if IncrementalTfidf.exists(path):
+      with pytest.raises(FileExistsError):
+        incremental.save(path)
+    incremental.save(path, overwrite=True)
+    incremental = IncrementalTfidf.load(path)
+    incremental.append(sentences[4:])
+    incremental.save(path)
+
+  loaded = IncrementalTfidf.load(path)
+  assert loaded.counts.shape == (loaded.n_documents_, loaded.n_features)
+  assert loaded.n_documents_ == len(sentences)
+  terms = loaded.get_feature_names_out()
+  assert len(set(terms)) == len(terms) == loaded.n_features
+  _assert_matches_a_refit(loaded, sentences)
+
+
+def test_saving_to_a_new_directory_writes_the_whole_body(tmp_path, sentences):
+  incremental = IncrementalTfidf(stop_words="english")
+  incremental.append(sentences[:4])
+  incremental.save(str(tmp_path / "first"))
+  incremental.append(sentences[4:])
+  incremental.save(str(tmp_path / "second"))
+  _assert_matches_a_refit(IncrementalTfidf.load(str(tmp_path / "second")), sentences)
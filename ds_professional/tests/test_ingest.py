@@ -0,0 +1,23 @@
+"""Tests of the single-node Parquet ingestion of lsa.ingest."""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from lsa.ingest import convert_csv_to_parquet, read_body_pandas
+
+
+@pytest.mark.parametrize("multi_line", [False, True])
+def test_partitioned_body_reads_back_in_csv_order(tmp_path, multi_line):
+  rng = np.random.default_rng(0)
+  n = 5000
+  sentences = ["line {}{}".format(i, "\nand more" if multi_line and i % 7 == 0 else "") for i in range(n)]
+  body = pd.DataFrame({"sentence": sentences, "title": rng.choice(["The Raven", "Charge"], n), "extra": 1})
+  body.to_csv(tmp_path / "body.csv", index=False)
+
+  convert_csv_to_parquet(str(tmp_path / "body.csv"), str(tmp_path / "body.parquet"), block_size=1 << 12,
+                         multi_line=multi_line)
+  read = read_body_pandas(str(tmp_path / "body.parquet"), arrow_dtypes=False)
+  assert list(read.columns) == ["sentence", "title"]
+  assert read["sentence"].tolist() == sentences
+  assert read["title"].tolist() == body["title"].tolist()
@@ -0,0 +1,45 @@
+"""Tests of the density plots of lsa.plotting."""
+
+import numpy as np
+import pytest
+
+from lsa.plotting import class_histograms, density_scatter, stratified_sample
+
+matplotlib = pytest.importorskip("matplotlib")
+matplotlib.use("Agg")
+
+
+@pytest.fixture
+def points():
+  rng = np.random.default_rng(0)
+  x, y = rng.normal(size=(2, 1000))
+  classes = np.where(rng.random(1000) < 0.5, "The Raven", "Charge").astype(object)
+  classes[::10] = np.nan
+  return x, y, classes
+
+
+def test_missing_classes_are_left_out_of_the_histograms(points):
+  x, y, classes = points
+  counts, class_values, _ = class_histograms(x, y, classes, bins=16)
+  assert list(class_values) == ["Charge", "The Raven"]
+  assert counts.sum() == 900
+  assert counts[1].sum() == (classes == "The Raven").sum()
+
+
+def test_missing_classes_are_never_sampled(points):
+  _, _, classes = points
+  rows = stratified_sample(classes, 50, random_state=0)
+  sampled = classes[rows]
+  assert len(rows) == 100
+  assert (sampled == "Charge").sum() == (sampled == "The Raven").sum() == 50
+
+
+def test_density_scatter_draws_a_nan_labelled_body(points):
+  import matplotlib.pyplot as plt
+
+  x, y, classes = points
+  fig, ax = plt.subplots()
+  counts, class_values, _ = density_scatter(ax, x, y, classes, bins=32, sample=20)
+  assert counts.sum() == 900
+  assert sorted(text.get_text() for text in ax.legend().get_texts()) == ["Charge", "The Raven"]
+  plt.close(fig)
@@ -0,0 +1,56 @@
+"""Tests of the micro-batching projection service."""
+
+import asyncio
+
+import numpy as np
+import pytest
+from sklearn.decomposition import TruncatedSVD
+from sklearn.feature_extraction.text import CountVectorizer
+
+from lsa.serving import TopicProjectionService, load_test
+
+TEXTS = ["quoth the raven nevermore", "once upon a midnight dreary", "the light brigade rode onward",
+         "half a league half a league", "the raven sat upon the bust", "cannon to the right of them"]
+
+
+@pytest.fixture(scope="module")
+def model():
+  vectorizer = CountVectorizer()
+  svd = TruncatedSVD(n_components=2, random_state=0).fit(vectorizer.fit_transform(TEXTS))
+  return vectorizer, svd
+
+
+def test_score_matches_the_batch_projection(model):
+  vectorizer, svd = model
+
+  async def run():
+    async with TopicProjectionService(vectorizer, svd.components_) as service:
+      return await asyncio.gather(*[service.score(text) for text in TEXTS])
+
+  np.testing.assert_allclose(np.vstack(asyncio.run(run())), svd.transform(vectorizer.transform(TEXTS)))
+
+
+def test_stop_serves_the_queued_requests_and_refuses_new_ones(model):
+  vectorizer, svd = model
+
+  async def run():
+    service = await TopicProjectionService(vectorizer, svd.components_, max_batch_size=2).start()
+    pending = [asyncio.ensure_future(service.score(text)) for text in TEXTS]
+    await asyncio.sleep(0)
+    await service.stop()
+    with pytest.raises(RuntimeError):
+      await service.score(TEXTS[0])
+    return await asyncio.wait_for(asyncio.gather(*pending), 5)
+
+  assert len(asyncio.run(run())) == len(TEXTS)
+
+
+def test_load_test_leaves_out_earlier_requests(model):
+  vectorizer, svd = model
+
+  async def run():
+    async with TopicProjectionService(vectorizer, svd.components_) as service:
+      await service.score("quoth the raven")
+      return await load_test(service, TEXTS, n_requests=50, concurrency=4)
+
+  assert asyncio.run(run())["requests"] == 50
@@ -0,0 +1,69 @@
+"""Tests of lsa.spark_lsa against the Scikit-Learn pipeline, on a local-mode session."""
+
+import numpy as np
+import pytest
+from sklearn.decomposition import TruncatedSVD
+from sklearn.feature_extraction.text import CountVectorizer
+
+pyspark = pytest.importorskip("pyspark")
+
+from pyspark.sql import SparkSession  # noqa: E402
+
+from lsa.spark_lsa import add_topic_columns, spark_lsa  # noqa: E402
+from lsa.svd import flip_signs  # noqa: E402
+from lsa.topics import topic_columns  # noqa: E402
+from lsa.vectorize import fused_count_tfidf, tfidf_from_counts  # noqa: E402
+
+NEW_SENTENCES = ["the raven and the valley of death", "a league of cannon", "nothing known here", None]
+
+
+@pytest.fixture(scope="module")
+def spark():
+  try:
+    session = (SparkSession.builder
+      .master("local[1]")
+      .appName("lsa-tests")
+      .config("spark.sql.execution.arrow.pyspark.enabled", "true")
+      .config("spark.ui.enabled", "false")
+      .getOrCreate())
+  except Exception as error:  # no Java, for instance
+    pytest.skip("no local Spark session: {}".format(error))
+  yield session
+  session.stop()
+
+
+@pytest.mark.parametrize("use_idf", [False, True])
+def test_add_topic_columns_matches_the_driver_projection(spark, use_idf, sentences):
+  matrices = fused_count_tfidf(sentences, min_df=1, stop_words="english")
+  X = matrices.tfidf if use_idf else matrices.counts
+  svd = TruncatedSVD(n_components=2, random_state=0).fit(X)
+  idf = matrices.idf if use_idf else None
+
+  df = spark.createDataFrame([(i, text) for i, text in enumerate(NEW_SENTENCES)], "id long, sentence string")
+  scored = add_topic_columns(df, matrices.vectorizer, svd.components_, idf=idf).orderBy("id").toPandas()
+
+  new_counts = matrices.vectorizer.transform([text or "" for text in NEW_SENTENCES])
+  expected = svd.transform(tfidf_from_counts(new_counts, idf=idf) if use_idf else new_counts)
+  assert list(scored.columns) == ["id", "sentence"] + topic_columns(2)
+  np.testing.assert_allclose(scored[topic_columns(2)].to_numpy(), expected, atol=1e-12)
+
+
+def test_spark_lsa_matches_truncated_svd(spark, sentences):
+  df = spark.createDataFrame([(i, text) for i, text in enumerate(sentences)], "id long, sentence string")
+  result = spark_lsa(df, n_components=2, text_col="sentence", min_df=1, stop_words="english")
+
+  vectorizer = CountVectorizer(min_df=1, stop_words="english")
+  counts = vectorizer.fit_transform(sentences).astype(np.float64)
+  svd = TruncatedSVD(n_components=2, algorithm="arpack").fit(counts)
+
+  # Spark orders the dictionary by frequency, Scikit-Learn alphabetically.
+  dictionary = result.encoding_matrix["terms"].tolist()
+  assert sorted(dictionary) == vectorizer.get_feature_names_out().tolist()
+  columns = [vectorizer.vocabulary_[term] for term in dictionary]
+  np.testing.assert_allclose(result.singular_values, svd.singular_values_, rtol=1e-6)
+  np.testing.assert_allclose(result.components, flip_signs(svd.components_)[:, columns], atol=1e-6)
+
+  encoded = result.topic_encoded_df.orderBy("id").toPandas()
+  assert list(encoded.columns) == topic_columns(2) + ["id", "sentence"]
+  np.testing.assert_allclose(encoded[topic_columns(2)].to_numpy(),
+                             counts @ flip_signs(svd.components_).T, atol=1e-6)
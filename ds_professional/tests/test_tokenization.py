@@ -0,0 +1,52 @@
+"""Tests of lsa.tokenization against Scikit-Learn's CountVectorizer."""
+
+import pickle
+
+import pytest
+from sklearn.feature_extraction.text import CountVectorizer
+
+from lsa.tokenization import TokenizationEngine, strip_accents
+
+
+def _assert_matches(engine, documents, **params):
+  vectorizer = CountVectorizer(stop_words="english", **params)
+  expected = vectorizer.fit_transform(documents)
+  terms, counts = engine.count(documents)
+  assert terms.tolist() == vectorizer.get_feature_names_out().tolist()
+  assert (counts != expected).nnz == 0
+
+
+@pytest.mark.parametrize("ngram_range", [(1, 1), (1, 2), (2, 3)])
+def test_count_matches_count_vectorizer(ngram_range, sentences):
+  _assert_matches(TokenizationEngine(ngram_range=ngram_range), sentences, ngram_range=ngram_range)
+
+
+def test_later_batches_only_hold_their_own_terms(sentences):
+  engine = TokenizationEngine(ngram_range=(1, 2))
+  engine.count(sentences[:3])
+  _assert_matches(engine, sentences[3:], ngram_range=(1, 2))
+
+
+def test_tables_are_emptied_past_max_table_size(sentences):
+  engine = TokenizationEngine(max_table_size=20)
+  engine.count(sentences[:3])
+  assert engine.table_size > 20
+  _assert_matches(engine, sentences[3:])
+  assert len(engine.terms) == len(CountVectorizer(stop_words="english").fit(sentences[3:]).vocabulary_)
+
+  engine.reset()
+  assert engine.table_size == 0
+
+
+def test_pickled_engine_keeps_its_configuration(sentences):
+  engine = pickle.loads(pickle.dumps(TokenizationEngine(ngram_range=(1, 2), max_table_size=100)))
+  assert engine.max_table_size == 100
+  _assert_matches(engine, sentences, ngram_range=(1, 2))
+
+
+def test_stop_words_are_tested_after_the_normalizers():
+  documents = ["Thé café is déjà vu", "ALL thé résumés", "Ａｌｌ ＴＨＥ ﬁnest"]
+  for ngram_range in [(1, 1), (1, 2)]:
+    engine = TokenizationEngine(ngram_range=ngram_range, normalizers=[strip_accents])
+    _assert_matches(engine, documents, ngram_range=ngram_range, strip_accents="unicode")
+    assert not {"the", "all", "all the", "the cafe"} & set(engine.count(documents)[0])